@@ -13,4 +13,8 @@ __author__ = "Nicholas Brochu"
 __version__ = "0.1.2"
 
 from .respectful_requester import RespectfulRequester
+from .retry_policy import RespectfulRetryPolicy
+from .cache import RespectfulMemoryCache, RespectfulRedisCache, RespectfulTieredCache
+from .coalescer import RespectfulCoalescer
+from .simulator import RespectfulSimulator
 from .exceptions import *
@@ -0,0 +1,320 @@
+from .exceptions import RequestsRespectfulConfigError, RequestsRespectfulRedisError
+from .utils import carries_credentials, has_unkeyable_body, request_fingerprint, serialize_response, deserialize_response
+
+import collections
+import email.utils
+import json
+import threading
+import time
+
+
+class RespectfulCache:
+
+    cacheable_methods = ("get", "head")
+    cacheable_status_codes = (200, 203, 300, 301, 308)
+
+    # Shared caches are visible to other processes and never hold 'private' responses
+    shared = False
+
+    def __init__(self, default_ttl=0, realm_ttls=None, stale_ttl=3600, revalidation_realms=None):
+        if not isinstance(default_ttl, (int, float)) or default_ttl < 0:
+            raise RequestsRespectfulConfigError("'default_ttl' must be a positive number")
+
+        if not isinstance(stale_ttl, (int, float)) or stale_ttl < 0:
+            raise RequestsRespectfulConfigError("'stale_ttl' must be a positive number")
+
+        if revalidation_realms is not None and type(revalidation_realms) != list:
+            raise RequestsRespectfulConfigError("'revalidation_realms' must be a list")
+
+        self.default_ttl = default_ttl
+        self.realm_ttls = dict(realm_ttls or dict())
+        self.stale_ttl = stale_ttl
+        self.revalidation_realms = revalidation_realms
+
+    def attach(self, requester):
+        pass
+
+    def is_cacheable_request(self, method, *args, **kwargs):
+        if method not in self.cacheable_methods or kwargs.get("stream"):
+            return False
+
+        # Responses to authenticated requests would be served to any caller of the same URL
+        if carries_credentials(kwargs) or has_unkeyable_body(kwargs):
+            return False
+
+        return len(args) > 0 or "url" in kwargs
+
+    # Requests differing in their headers (e.g. an API key header), body or redirect handling get their own entries
+    def cache_key(self, method, url, params=None, headers=None, data=None, json=None, allow_redirects=True):
+        return request_fingerprint(
+            method, url, params=params, headers=headers, data=data, json=json, allow_redirects=allow_redirects
+        ).hexdigest()
+
+    def fetch(self, key):
+        return self._get(key)
+
+    def store(self, key, response, realms):
+        if response.status_code not in self.cacheable_status_codes:
+            return None
+
+        return self._store_entry(key, response, response.headers, realms)
+
+    def refresh(self, key, entry, not_modified_response, realms):
+        response = entry["response"]
+
+        for header in ("Date", "Expires", "Cache-Control", "ETag", "Last-Modified"):
+            if header in not_modified_response.headers:
+                response.headers[header] = not_modified_response.headers[header]
+
+        self._store_entry(key, response, response.headers, realms)
+
+        return response
+
+    def is_fresh(self, entry):
+        return entry["fresh_until"] > time.time()
+
+    def conditional_headers(self, entry):
+        headers = dict()
+
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def ttl(self, headers, realms):
+        directives = self._cache_control_directives(headers)
+
+        if "no-store" in directives or ("private" in directives and self.shared) or headers.get("Vary", "").strip().lower() not in ("", "accept-encoding"):
+            return None
+
+        realm_ttls = [self.realm_ttls[realm] for realm in realms if realm in self.realm_ttls]
+
+        if len(realm_ttls):
+            return min(realm_ttls)
+
+        if "no-cache" in directives:
+            return 0
+
+        for directive in ("s-maxage", "max-age"):
+            if directive in directives:
+                try:
+                    return max(0, int(directives[directive]))
+                except (TypeError, ValueError):
+                    return 0
+
+        if "Expires" in headers:
+            expires_at = self._parse_http_date(headers["Expires"])
+            date = self._parse_http_date(headers.get("Date")) or time.time()
+
+            return max(0, expires_at - date) if expires_at is not None else 0
+
+        return self.default_ttl
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def _store_entry(self, key, response, headers, realms):
+        ttl = self.ttl(headers, realms)
+
+        if ttl is None:
+            self._delete(key)
+            return None
+
+        entry = {
+            "response": response,
+            "fresh_until": time.time() + ttl,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified")
+        }
+
+        # Responses carrying validators are kept around past their freshness to be revalidated
+        expire = ttl + self.stale_ttl if entry["etag"] or entry["last_modified"] else ttl
+
+        if expire <= 0:
+            self._delete(key)
+            return None
+
+        self._set(key, entry, expire)
+
+        return entry
+
+    def _get(self, key):
+        raise NotImplementedError()
+
+    def _set(self, key, entry, expire):
+        raise NotImplementedError()
+
+    def _delete(self, key):
+        raise NotImplementedError()
+
+    @staticmethod
+    def _cache_control_directives(headers):
+        directives = dict()
+
+        for directive in headers.get("Cache-Control", "").split(","):
+            directive = directive.strip()
+
+            if not directive:
+                continue
+
+            name, _, value = directive.partition("=")
+            directives[name.strip().lower()] = value.strip().strip('"') or None
+
+        return directives
+
+    @staticmethod
+    def _parse_http_date(value):
+        if not value:
+            return None
+
+        parsed_date = email.utils.parsedate_tz(value)
+
+        return email.utils.mktime_tz(parsed_date) if parsed_date is not None else None
+
+
+class RespectfulMemoryCache(RespectfulCache):
+
+    def __init__(self, max_entries=1024, **kwargs):
+        if type(max_entries) != int or max_entries < 1:
+            raise RequestsRespectfulConfigError("'max_entries' must be a positive integer")
+
+        RespectfulCache.__init__(self, **kwargs)
+
+        self.max_entries = max_entries
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._entries.pop(key, None)
+
+            if item is None or item[0] <= time.time():
+                return None
+
+            self._entries[key] = item
+
+            return item[1]
+
+    def _set(self, key, entry, expire):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + expire, entry)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RespectfulRedisCache(RespectfulCache):
+
+    shared = True
+
+    def __init__(self, redis=None, **kwargs):
+        RespectfulCache.__init__(self, **kwargs)
+
+        self.redis = redis
+        self.redis_prefix = "RespectfulRequester"
+
+        self._redis_call = lambda func, *args, **kwargs: func(*args, **kwargs)
+
+    def attach(self, requester):
+        if self.redis is None:
+            self.redis = requester.redis
+
+        self.redis_prefix = requester.redis_prefix
+
+        # Redis calls go through the degraded mode of the requester: while Redis is unavailable, the cache only misses
+        self._redis_call = requester._redis_call
+
+    def clear(self):
+        for key in self.redis.scan_iter(match="%s:CACHE:*" % self.redis_prefix):
+            self.redis.delete(key)
+
+    def _cache_redis_key(self, key):
+        return "%s:CACHE:%s" % (self.redis_prefix, key)
+
+    def _get(self, key):
+        try:
+            value = self._redis_call(self.redis.get, self._cache_redis_key(key))
+        except RequestsRespectfulRedisError:
+            return None
+
+        if value is None:
+            return None
+
+        entry = json.loads(value.decode("utf-8"))
+        entry["response"] = deserialize_response(entry["response"])
+
+        return entry
+
+    def _set(self, key, entry, expire):
+        value = json.dumps(dict(entry, response=serialize_response(entry["response"])))
+
+        try:
+            self._redis_call(self.redis.psetex, self._cache_redis_key(key), max(1, int(expire * 1000)), value)
+        except RequestsRespectfulRedisError:
+            pass
+
+    def _delete(self, key):
+        try:
+            self._redis_call(self.redis.delete, self._cache_redis_key(key))
+        except RequestsRespectfulRedisError:
+            pass
+
+
+class RespectfulTieredCache(RespectfulCache):
+
+    def __init__(self, tiers, **kwargs):
+        if type(tiers) != list or not len(tiers):
+            raise RequestsRespectfulConfigError("'tiers' must be a non-empty list of caches")
+
+        RespectfulCache.__init__(self, **kwargs)
+
+        self.tiers = tiers
+
+    @property
+    def shared(self):
+        return any(tier.shared for tier in self.tiers)
+
+    def attach(self, requester):
+        for tier in self.tiers:
+            tier.attach(requester)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def _get(self, key):
+        for index, tier in enumerate(self.tiers):
+            entry = tier._get(key)
+
+            if entry is not None:
+                # Promote the hit to the faster tiers for the remainder of its freshness
+                expire = entry["fresh_until"] - time.time()
+
+                if expire > 0:
+                    for faster_tier in self.tiers[:index]:
+                        faster_tier._set(key, entry, expire)
+
+                return entry
+
+        return None
+
+    def _set(self, key, entry, expire):
+        for tier in self.tiers:
+            tier._set(key, entry, expire)
+
+    def _delete(self, key):
+        for tier in self.tiers:
+            tier._delete(key)
@@ -0,0 +1,178 @@
+from .exceptions import RequestsRespectfulConfigError, RequestsRespectfulRedisError
+from .utils import carries_credentials, has_unkeyable_body, request_fingerprint, serialize_response, deserialize_response
+
+import json
+import threading
+import time
+import uuid
+
+import requests
+
+
+class RespectfulCoalescer:
+
+    coalescable_methods = ("get", "head", "options")
+
+    def __init__(self, distributed=False, redis=None, lock_timeout=30, poll_interval=0.05, result_ttl=10):
+        if not isinstance(lock_timeout, (int, float)) or lock_timeout <= 0:
+            raise RequestsRespectfulConfigError("'lock_timeout' must be a positive number")
+
+        if not isinstance(poll_interval, (int, float)) or poll_interval <= 0:
+            raise RequestsRespectfulConfigError("'poll_interval' must be a positive number")
+
+        if not isinstance(result_ttl, (int, float)) or result_ttl <= 0:
+            raise RequestsRespectfulConfigError("'result_ttl' must be a positive number")
+
+        self.distributed = distributed
+        self.redis = redis
+        self.redis_prefix = "RespectfulRequester"
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+
+        self._flights = dict()
+        self._lock = threading.Lock()
+
+        self._redis_call = lambda func, *args, **kwargs: func(*args, **kwargs)
+
+    def attach(self, requester):
+        if self.redis is None:
+            self.redis = requester.redis
+
+        self.redis_prefix = requester.redis_prefix
+
+        # Redis calls go through the degraded mode of the requester: while Redis is unavailable, calls aren't coalesced
+        self._redis_call = requester._redis_call
+
+    def is_coalescable_request(self, method, *args, **kwargs):
+        if method not in self.coalescable_methods or kwargs.get("stream"):
+            return False
+
+        # A follower would be handed the response obtained with the credentials of the leader
+        if carries_credentials(kwargs) or has_unkeyable_body(kwargs):
+            return False
+
+        return len(args) > 0 or "url" in kwargs
+
+    # Calls differing in their headers (e.g. an API key header), body or redirect handling are never shared
+    def coalesce_key(self, method, url, params=None, realms=None, cost=1, wait=False, headers=None, data=None, json=None, allow_redirects=True):
+        fingerprint = request_fingerprint(
+            method, url, params=params, headers=headers, data=data, json=json, allow_redirects=allow_redirects
+        )
+
+        fingerprint.update(self._admission_key(realms, cost, wait))
+
+        return fingerprint.hexdigest()
+
+    # Followers wait on the leader for up to 'timeout' seconds, then call 'fallback' (or 'func') themselves
+    def perform(self, key, func, timeout=None, fallback=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+
+            if is_leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not is_leader:
+            if not flight.done.wait(timeout):
+                return (fallback or func)()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.result
+
+        try:
+            flight.result = self._perform_distributed(key, func, timeout, fallback) if self.distributed else func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+            flight.done.set()
+
+        return flight.result
+
+    def _perform_distributed(self, key, func, timeout=None, fallback=None):
+        lock_key = "%s:COALESCE:%s" % (self.redis_prefix, key)
+
+        if timeout is not None and timeout < self.lock_timeout:
+            deadline = time.time() + timeout
+            timeout_func = fallback or func
+        else:
+            deadline = time.time() + self.lock_timeout
+            timeout_func = func
+
+        while True:
+            token = str(uuid.uuid4())
+
+            try:
+                is_leader = self._redis_call(self.redis.set, lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+                leader_token = None if is_leader else self._redis_call(self.redis.get, lock_key)
+            except RequestsRespectfulRedisError:
+                return func()
+
+            if is_leader:
+                return self._lead_flight(lock_key, token, func)
+
+            # The leader publishes its result under its own token so late callers never see a previous flight
+            while leader_token is not None and time.time() < deadline:
+                try:
+                    is_flight_over = self._redis_call(self.redis.get, lock_key) != leader_token
+                    result = self._redis_call(self.redis.get, "%s:RESULT:%s" % (lock_key, leader_token.decode("utf-8")))
+                except RequestsRespectfulRedisError:
+                    return func()
+
+                if result is not None:
+                    return deserialize_response(json.loads(result.decode("utf-8")))
+
+                if is_flight_over:
+                    break
+
+                time.sleep(self.poll_interval)
+
+            # The leader failed or is taking longer than the timeout, perform the call without coalescing
+            if time.time() >= deadline:
+                return timeout_func()
+
+    def _lead_flight(self, lock_key, token, func):
+        try:
+            result = func()
+
+            # Results are published as JSON rather than pickled, so writing to Redis doesn't allow running code
+            if isinstance(result, requests.Response):
+                try:
+                    self._redis_call(
+                        self.redis.psetex,
+                        "%s:RESULT:%s" % (lock_key, token),
+                        int(self.result_ttl * 1000),
+                        json.dumps(serialize_response(result))
+                    )
+                except RequestsRespectfulRedisError:
+                    pass  # The followers perform the call themselves once they notice the flight is over
+
+            return result
+        finally:
+            try:
+                if self._redis_call(self.redis.get, lock_key) == token.encode("utf-8"):
+                    self._redis_call(self.redis.delete, lock_key)
+            except RequestsRespectfulRedisError:
+                pass  # The lock expires on its own after 'lock_timeout' seconds
+
+
+    # Only calls charged to the same realms at the same cost are shared, the follower's admission is the leader's.
+    # Calls that don't wait on rate-limited realms never queue behind a leader that does
+    @staticmethod
+    def _admission_key(realms, cost, wait):
+        return json.dumps([sorted(realms or list()), cost, bool(wait)], sort_keys=True).encode("utf-8")
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
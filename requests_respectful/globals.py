@@ -16,10 +16,16 @@ default_config = {
     "redis": {
         "host": "localhost",
         "port": 6379,
-        "database": 0
+        "database": 0,
+        "socket_timeout": 5,
+        "socket_connect_timeout": 5
     },
     "safety_threshold": 10,
-    "requests_module_name": "requests"
+    "requests_module_name": "requests",
+    "concurrency_lease_ttl": 60,
+    "redis_fallback": "fail_closed",
+    "redis_fallback_ratio": 0.5,
+    "redis_retry_interval": 5
 }
 
 try:
@@ -42,6 +48,38 @@ try:
                 "'requests_module_name' key must be a string in 'requests-respectful.config.yml'"
             )
 
+    if "concurrency_lease_ttl" not in config:
+        config["concurrency_lease_ttl"] = default_config.get("concurrency_lease_ttl")
+    else:
+        if type(config["concurrency_lease_ttl"]) != int or config["concurrency_lease_ttl"] <= 0:
+            raise RequestsRespectfulConfigError(
+                "'concurrency_lease_ttl' key must be a positive integer in 'requests-respectful.config.yml'"
+            )
+
+    if "redis_fallback" not in config:
+        config["redis_fallback"] = default_config.get("redis_fallback")
+    else:
+        if config["redis_fallback"] not in ["fail_closed", "fail_open", "local"]:
+            raise RequestsRespectfulConfigError(
+                "'redis_fallback' key must be one of 'fail_closed', 'fail_open' or 'local' in 'requests-respectful.config.yml'"
+            )
+
+    if "redis_fallback_ratio" not in config:
+        config["redis_fallback_ratio"] = default_config.get("redis_fallback_ratio")
+    else:
+        if not isinstance(config["redis_fallback_ratio"], (int, float)) or not 0 < config["redis_fallback_ratio"] <= 1:
+            raise RequestsRespectfulConfigError(
+                "'redis_fallback_ratio' key must be a number between 0 (exclusive) and 1 in 'requests-respectful.config.yml'"
+            )
+
+    if "redis_retry_interval" not in config:
+        config["redis_retry_interval"] = default_config.get("redis_retry_interval")
+    else:
+        if not isinstance(config["redis_retry_interval"], (int, float)) or config["redis_retry_interval"] <= 0:
+            raise RequestsRespectfulConfigError(
+                "'redis_retry_interval' key must be a positive number in 'requests-respectful.config.yml'"
+            )
+
     if "redis" not in config:
         raise RequestsRespectfulConfigError("'redis' key is missing from 'requests-respectful.config.yml'")
 
@@ -59,6 +97,13 @@ try:
                 "is" if len(missing_redis_keys) == 1 else "are"
             )
         )
+
+    for optional_redis_key in ["socket_timeout", "socket_connect_timeout"]:
+        if config["redis"].get(optional_redis_key) is not None:
+            if not isinstance(config["redis"][optional_redis_key], (int, float)) or config["redis"][optional_redis_key] <= 0:
+                raise RequestsRespectfulConfigError(
+                    "'%s' must be a positive number in the 'redis' configuration key in 'requests-respectful.config.yml'" % optional_redis_key
+                )
 except FileNotFoundError:
     config = copy.deepcopy(default_config)
 
@@ -67,5 +112,7 @@ except FileNotFoundError:
 redis = StrictRedis(
     host=config["redis"]["host"],
     port=config["redis"]["port"],
-    db=config["redis"]["database"]
+    db=config["redis"]["database"],
+    socket_timeout=config["redis"].get("socket_timeout", default_config["redis"]["socket_timeout"]),
+    socket_connect_timeout=config["redis"].get("socket_connect_timeout", default_config["redis"]["socket_connect_timeout"])
 )
@@ -0,0 +1,140 @@
+from .scripts import WINDOW_BUCKETS
+
+import collections
+import math
+import threading
+import time
+
+
+# In-process counterpart of the ADMIT_REQUEST script (see scripts.py), used when Redis can't be reached
+class LocalAdmission:
+
+    def __init__(self, clock=time.time, journal=False):
+        self.clock = clock
+        self.journal = journal
+
+        self._windows = dict()
+        self._leases = dict()
+        self._journal = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def admit(self, realms, realm_limits, realm_costs, request_uuid, safety_threshold=0, lease_ttl=60000, ratio=1.0):
+        with self._lock:
+            now = int(self.clock() * 1000)
+
+            rate_limited_realms = list()
+            concurrency_limited_realms = list()
+
+            for realm in realms:
+                limits = realm_limits[realm]
+                cost = realm_costs[realm]
+
+                is_rate_limited = False
+
+                for max_requests, timespan in self._realm_windows(limits):
+                    if self._units_in_window(realm, timespan, now) + cost > int(max_requests * ratio) - safety_threshold:
+                        is_rate_limited = True
+
+                if is_rate_limited:
+                    rate_limited_realms.append(realm)
+
+                if limits["max_concurrent"] is not None:
+                    leases = self._leases.setdefault(realm, dict())
+
+                    for lease_uuid, expires_at in list(leases.items()):
+                        if expires_at <= now:
+                            del leases[lease_uuid]
+
+                    if len(leases) >= max(1, int(limits["max_concurrent"] * ratio)):
+                        concurrency_limited_realms.append(realm)
+
+            if len(rate_limited_realms) or len(concurrency_limited_realms):
+                return rate_limited_realms, concurrency_limited_realms, now
+
+            for realm in realms:
+                limits = realm_limits[realm]
+                cost = realm_costs[realm]
+
+                for timespan in set(timespan for max_requests, timespan in self._realm_windows(limits)):
+                    self._record_window_units(realm, timespan, now, cost)
+
+                if limits["max_concurrent"] is not None:
+                    self._leases[realm][request_uuid] = now + lease_ttl
+
+                if self.journal:
+                    self._journal[(realm, request_uuid)] = [now, cost]
+
+            return rate_limited_realms, concurrency_limited_realms, now
+
+    def record(self, realms, realm_costs, request_uuid):
+        with self._lock:
+            now = int(self.clock() * 1000)
+
+            if self.journal:
+                for realm in realms:
+                    self._journal[(realm, request_uuid)] = [now, realm_costs[realm]]
+
+            return now
+
+    def release(self, realms, request_uuid):
+        with self._lock:
+            for realm in realms:
+                self._leases.get(realm, dict()).pop(request_uuid, None)
+
+    def renew(self, realms, request_uuid, lease_ttl=60000):
+        with self._lock:
+            now = int(self.clock() * 1000)
+
+            for realm in realms:
+                leases = self._leases.get(realm, dict())
+
+                if request_uuid in leases:
+                    leases[request_uuid] = now + lease_ttl
+
+    def correct(self, realms, request_uuid, admitted_at, realm_cost_deltas):
+        with self._lock:
+            for realm in realms:
+                for timespan in [timespan for window_realm, timespan in self._windows if window_realm == realm]:
+                    self._record_window_units(realm, timespan, admitted_at, realm_cost_deltas[realm])
+
+                if (realm, request_uuid) in self._journal:
+                    self._journal[(realm, request_uuid)][1] += realm_cost_deltas[realm]
+
+    def units_in_window(self, realm, timespan):
+        with self._lock:
+            return self._units_in_window(realm, timespan, int(self.clock() * 1000))
+
+    def drain_journal(self):
+        with self._lock:
+            journal = [(realm, request_uuid, admitted_at, cost) for (realm, request_uuid), (admitted_at, cost) in self._journal.items()]
+            self._journal.clear()
+
+            return journal
+
+    def restore_journal(self, journal):
+        with self._lock:
+            for realm, request_uuid, admitted_at, cost in journal:
+                self._journal[(realm, request_uuid)] = [admitted_at, cost]
+
+    def _units_in_window(self, realm, timespan, now):
+        buckets = self._windows.get((realm, timespan), dict())
+        oldest_bucket = now // self._window_bucket_size(timespan) - WINDOW_BUCKETS
+
+        for bucket in [bucket for bucket in buckets if bucket < oldest_bucket]:
+            del buckets[bucket]
+
+        return sum(buckets.values())
+
+    def _record_window_units(self, realm, timespan, at, units):
+        buckets = self._windows.setdefault((realm, timespan), dict())
+        bucket = at // self._window_bucket_size(timespan)
+
+        buckets[bucket] = buckets.get(bucket, 0) + units
+
+    @staticmethod
+    def _realm_windows(limits):
+        return [(limits["max_requests"], limits["timespan"])] + list(limits["windows"])
+
+    @staticmethod
+    def _window_bucket_size(timespan):
+        return int(math.ceil(timespan * 1000.0 / WINDOW_BUCKETS))
@@ -1,10 +1,15 @@
 from .globals import default_config, config, redis
 from .exceptions import RequestsRespectfulError, RequestsRespectfulConfigError, RequestsRespectfulRateLimitedError, RequestsRespectfulRedisError
+from .scripts import ADMIT_REQUEST, CORRECT_REQUEST_COST, MIGRATE_WINDOWS, RECORD_REQUESTS, RENEW_CONCURRENCY_LEASES, THROTTLE_BANDWIDTH, WINDOW_BUCKETS
+from .local_admission import LocalAdmission
 
-from redis import StrictRedis, ConnectionError
+from redis import StrictRedis, ConnectionError, TimeoutError as RedisTimeoutError
 
 import uuid
 import inspect
+import json
+import math
+import threading
 import time
 
 import requests
@@ -14,13 +19,37 @@ import warnings
 
 class RespectfulRequester:
 
-    def __init__(self):
+    def __init__(self, cache=None, coalescer=None):
         self.redis = redis
+        self.cache = cache
+        self.coalescer = coalescer
+        self.session = requests.Session()
+
+        self._admit_request_script = self.redis.register_script(ADMIT_REQUEST)
+        self._correct_request_cost_script = self.redis.register_script(CORRECT_REQUEST_COST)
+        self._record_requests_script = self.redis.register_script(RECORD_REQUESTS)
+        self._throttle_bandwidth_script = self.redis.register_script(THROTTLE_BANDWIDTH)
+        self._renew_concurrency_leases_script = self.redis.register_script(RENEW_CONCURRENCY_LEASES)
+        self._migrate_windows_script = self.redis.register_script(MIGRATE_WINDOWS)
+
+        # Degraded mode state: the realm limits seen in the last admissions and the requests admitted without Redis
+        self._realm_limits = dict()
+        self._local_admission = LocalAdmission(journal=True)
+        self._redis_unavailable_at = None
 
         try:
             self.redis.echo("Testing Connection")
-        except ConnectionError:
-            raise RequestsRespectfulRedisError("Could not establish a connection to the provided Redis server")
+        except (ConnectionError, RedisTimeoutError):
+            if config["redis_fallback"] == "fail_closed":
+                raise RequestsRespectfulRedisError("Could not establish a connection to the provided Redis server")
+
+            self._redis_unavailable_at = time.time()
+
+        if self.cache is not None:
+            self.cache.attach(self)
+
+        if self.coalescer is not None:
+            self.coalescer.attach(self)
 
     def __getattr__(self, attr):
         if attr in ["delete", "get", "head", "options", "patch", "post", "put"]:
@@ -32,36 +61,78 @@ class RespectfulRequester:
     def redis_prefix(self):
         return "RespectfulRequester"
 
-    def request(self, request_func, realm=None, realms=None, wait=False):
+    def request(self, request_func, realm=None, realms=None, wait=False, wait_timeout=None, retry_policy=None, cost=1):
         if realm is not None:
             warnings.warn("'realm' kwarg will be removed in favor of providing a 'realms' list starting in 0.3.0", DeprecationWarning)
             realms = [realm]
 
-        registered_realms = self.fetch_registered_realms()
+        return self._request(request_func, realms, wait, wait_timeout, retry_policy, cost)
 
-        for r in realms:
-            if r not in registered_realms:
-                raise RequestsRespectfulError("Realm '%s' hasn't been registered" % realm)
+    def stream(self, method, url, realms=None, chunk_size=8192, wait=False, wait_timeout=None, retry_policy=None, cost=1, **kwargs):
+        if realms is None or not len(realms):
+            raise RequestsRespectfulError("'realms' is a required kwarg")
 
-        if wait:
-            while True:
+        # The realms, the admission and the response status are checked before returning, not on the first chunk.
+        # The concurrency leases are held until the response is closed, the body is downloaded after the headers
+        response = self._request(
+            lambda: self.session.request(method.upper(), url, stream=True, **kwargs),
+            realms,
+            wait=wait,
+            wait_timeout=wait_timeout,
+            retry_policy=retry_policy,
+            cost=cost,
+            hold_leases=True
+        )
+
+        try:
+            response.raise_for_status()
+
+            bandwidth_limits = dict()
+
+            for realm in realms:
                 try:
-                    return self._perform_request(request_func, realms=realms)
-                except RequestsRespectfulRateLimitedError:
-                    pass
+                    max_bytes_per_second = self._redis_call(self.realm_max_bytes_per_second, realm)
+                except RequestsRespectfulRedisError:
+                    if config["redis_fallback"] == "fail_closed":
+                        raise
 
-                time.sleep(1)
-        else:
-            return self._perform_request(request_func, realms=realms)
+                    max_bytes_per_second = None
+
+                if max_bytes_per_second is not None:
+                    bandwidth_limits[realm] = max_bytes_per_second
+        except Exception:
+            self._close_response(response)
+            raise
+
+        chunks = self._stream_chunks(response, chunk_size, bandwidth_limits)
+
+        # Runs the generator into its try block, so that closing or collecting it closes the response even if never iterated
+        next(chunks)
+
+        return chunks
 
     def fetch_registered_realms(self):
         return list(map(lambda k: k.decode("utf-8"), self.redis.smembers("%s:REALMS" % self.redis_prefix)))
 
-    def register_realm(self, realm, max_requests, timespan):
+    def register_realm(self, realm, max_requests, timespan, max_bytes_per_second=None, max_concurrent=None, windows=None):
         redis_key = self._realm_redis_key(realm)
 
+        if windows is not None and not self._are_valid_windows(windows):
+            raise RequestsRespectfulError("'windows' must be a list of (max_requests, timespan) positive integer pairs")
+
         if not self.redis.hexists(redis_key, "max_requests"):
-            self.redis.hmset(redis_key, {"max_requests": max_requests, "timespan": timespan})
+            realm_info = {"max_requests": max_requests, "timespan": timespan}
+
+            if windows:
+                realm_info["windows"] = json.dumps([list(window) for window in windows])
+
+            if max_bytes_per_second is not None:
+                realm_info["max_bytes_per_second"] = max_bytes_per_second
+
+            if max_concurrent is not None:
+                realm_info["max_concurrent"] = max_concurrent
+
+            self.redis.hmset(redis_key, realm_info)
             self.redis.sadd("%s:REALMS" % self.redis_prefix, realm)
 
         return True
@@ -74,20 +145,32 @@ class RespectfulRequester:
 
     def update_realm(self, realm, **kwargs):
         redis_key = self._realm_redis_key(realm)
-        updatable_keys = ["max_requests", "timespan"]
+        updatable_keys = ["max_requests", "timespan", "max_bytes_per_second", "max_concurrent"]
+
+        previous_timespans = self._realm_timespans(realm)
 
         for updatable_key in updatable_keys:
             if updatable_key in kwargs and type(kwargs[updatable_key]) == int:
                 self.redis.hset(redis_key, updatable_key, kwargs[updatable_key])
 
+        if "windows" in kwargs and self._are_valid_windows(kwargs["windows"]):
+            if len(kwargs["windows"]):
+                self.redis.hset(redis_key, "windows", json.dumps([list(window) for window in kwargs["windows"]]))
+            else:
+                self.redis.hdel(redis_key, "windows")
+
+        # Counters are kept per timespan, the units recorded in the previous windows carry over to the new ones
+        if len(previous_timespans) and self._realm_timespans(realm) != previous_timespans:
+            self._migrate_windows_script(args=[self.redis_prefix, realm] + sorted(previous_timespans))
+
         return True
 
     def unregister_realm(self, realm):
-        self.redis.delete(self._realm_redis_key(realm))
-        self.redis.srem("%s:REALMS" % self.redis_prefix, realm)
+        redis_keys = [self._realm_redis_key(realm), "%s:LEASES:%s" % (self.redis_prefix, realm)]
+        redis_keys += [self._window_redis_key(realm, timespan) for timespan in self._realm_timespans(realm)]
 
-        request_keys = self.redis.keys("%s:REQUEST:%s:*" % (self.redis_prefix, realm))
-        [self.redis.delete(k) for k in request_keys]
+        self.redis.delete(*redis_keys)
+        self.redis.srem("%s:REALMS" % self.redis_prefix, realm)
 
         return True
 
@@ -105,6 +188,39 @@ class RespectfulRequester:
         realm_info = self._fetch_realm_info(realm)
         return int(realm_info["timespan".encode("utf-8")].decode("utf-8"))
 
+    def realm_windows(self, realm):
+        realm_info = self._fetch_realm_info(realm)
+
+        windows = [(
+            int(realm_info["max_requests".encode("utf-8")].decode("utf-8")),
+            int(realm_info["timespan".encode("utf-8")].decode("utf-8"))
+        )]
+
+        encoded_windows = realm_info.get("windows".encode("utf-8"))
+
+        if encoded_windows is not None:
+            windows += [tuple(window) for window in json.loads(encoded_windows.decode("utf-8"))]
+
+        return windows
+
+    def realm_max_bytes_per_second(self, realm):
+        realm_info = self._fetch_realm_info(realm)
+        max_bytes_per_second = realm_info.get("max_bytes_per_second".encode("utf-8"))
+
+        return int(max_bytes_per_second.decode("utf-8")) if max_bytes_per_second is not None else None
+
+    def realm_max_concurrent(self, realm):
+        realm_info = self._fetch_realm_info(realm)
+        max_concurrent = realm_info.get("max_concurrent".encode("utf-8"))
+
+        return int(max_concurrent.decode("utf-8")) if max_concurrent is not None else None
+
+    def memory_usage(self, realm):
+        redis_keys = [self._realm_redis_key(realm), "%s:LEASES:%s" % (self.redis_prefix, realm)]
+        redis_keys += [self._window_redis_key(realm, timespan) for timespan in self._realm_timespans(realm)]
+
+        return sum(self.redis.execute_command("MEMORY", "USAGE", redis_key) or 0 for redis_key in redis_keys)
+
     @classmethod
     def configure(cls, **kwargs):
         if "redis" in kwargs:
@@ -124,13 +240,20 @@ class RespectfulRequester:
                     "is" if len(missing_redis_keys) == 1 else "are"
                 ))
 
+            for optional_redis_key in ["socket_timeout", "socket_connect_timeout"]:
+                if kwargs["redis"].get(optional_redis_key) is not None:
+                    if not isinstance(kwargs["redis"][optional_redis_key], (int, float)) or kwargs["redis"][optional_redis_key] <= 0:
+                        raise RequestsRespectfulConfigError("'%s' must be a positive number in the 'redis' configuration key" % optional_redis_key)
+
             config["redis"] = kwargs["redis"]
 
             global redis
             redis = StrictRedis(
                 host=config["redis"]["host"],
                 port=config["redis"]["port"],
-                db=config["redis"]["database"]
+                db=config["redis"]["database"],
+                socket_timeout=config["redis"].get("socket_timeout", default_config["redis"]["socket_timeout"]),
+                socket_connect_timeout=config["redis"].get("socket_connect_timeout", default_config["redis"]["socket_connect_timeout"])
             )
 
         if "safety_threshold" in kwargs:
@@ -145,6 +268,30 @@ class RespectfulRequester:
 
             config["requests_module_name"] = kwargs["requests_module_name"]
 
+        if "concurrency_lease_ttl" in kwargs:
+            if type(kwargs["concurrency_lease_ttl"]) != int or kwargs["concurrency_lease_ttl"] <= 0:
+                raise RequestsRespectfulConfigError("'concurrency_lease_ttl' key must be a positive integer")
+
+            config["concurrency_lease_ttl"] = kwargs["concurrency_lease_ttl"]
+
+        if "redis_fallback" in kwargs:
+            if kwargs["redis_fallback"] not in ["fail_closed", "fail_open", "local"]:
+                raise RequestsRespectfulConfigError("'redis_fallback' key must be one of 'fail_closed', 'fail_open' or 'local'")
+
+            config["redis_fallback"] = kwargs["redis_fallback"]
+
+        if "redis_fallback_ratio" in kwargs:
+            if not isinstance(kwargs["redis_fallback_ratio"], (int, float)) or not 0 < kwargs["redis_fallback_ratio"] <= 1:
+                raise RequestsRespectfulConfigError("'redis_fallback_ratio' key must be a number between 0 (exclusive) and 1")
+
+            config["redis_fallback_ratio"] = kwargs["redis_fallback_ratio"]
+
+        if "redis_retry_interval" in kwargs:
+            if not isinstance(kwargs["redis_retry_interval"], (int, float)) or kwargs["redis_retry_interval"] <= 0:
+                raise RequestsRespectfulConfigError("'redis_retry_interval' key must be a positive number")
+
+            config["redis_retry_interval"] = kwargs["redis_retry_interval"]
+
         return config
 
     @classmethod
@@ -154,47 +301,393 @@ class RespectfulRequester:
 
         return config
 
-    def _perform_request(self, request_func, realms=None):
+    def _request(self, request_func, realms, wait=False, wait_timeout=None, retry_policy=None, cost=1, hold_leases=False):
+        try:
+            registered_realms = self._redis_call(self.fetch_registered_realms)
+        except RequestsRespectfulRedisError:
+            if config["redis_fallback"] == "fail_closed":
+                raise
+
+            # Realms can't be verified without Redis, the admission applies the fallback policy on its own
+            registered_realms = realms
+
+        for r in realms:
+            if r not in registered_realms:
+                raise RequestsRespectfulError("Realm '%s' hasn't been registered" % r)
+
+        if not callable(cost):
+            self._realm_costs(realms, cost)
+
+        deadline = None if wait_timeout is None else time.time() + wait_timeout
+
+        if retry_policy is None:
+            return self._perform_admitted_request(request_func, realms=realms, wait=wait, deadline=deadline, cost=cost, hold_leases=hold_leases)
+
+        attempt = 1
+
+        while True:
+            response = None
+            error = None
+
+            try:
+                response = self._perform_admitted_request(request_func, realms=realms, wait=wait, deadline=deadline, cost=cost, hold_leases=hold_leases)
+            except RequestsRespectfulRateLimitedError:
+                raise
+            except Exception as e:
+                if attempt >= retry_policy.max_attempts or not retry_policy.should_retry_exception(e):
+                    raise
+
+                error = e
+
+            if error is None and (attempt >= retry_policy.max_attempts or not retry_policy.should_retry_response(response)):
+                return response
+
+            delay = retry_policy.backoff(attempt, response=response)
+
+            if deadline is not None and time.time() + delay > deadline:
+                if error is not None:
+                    raise error
+
+                return response
+
+            # The discarded response would otherwise keep its pooled connection and its leases (i.e. when streamed)
+            if response is not None:
+                self._close_response(response)
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _perform_request(self, request_func, realms=None, cost=1, hold_leases=False, reject_inadmissible=False):
         self._validate_request_func(request_func)
 
-        rate_limited_realms = list()
+        request_uuid = str(uuid.uuid4())
+
+        # Callable costs are only known once the response is in, the request is admitted at 1 unit until then
+        realm_costs = self._realm_costs(realms, 1 if callable(cost) else cost)
+        realm_cost_args = list()
 
         for realm in realms:
-            if not self._can_perform_request(realm):
-                rate_limited_realms.append(realm)
+            realm_cost_args += [realm, realm_costs[realm]]
 
-        if not len(rate_limited_realms):
-            for realm in realms:
-                request_uuid = str(uuid.uuid4())
+        try:
+            # The rate check, the request records and the concurrency leases all happen in one atomic script
+            rate_limited_realms, concurrency_limited_realms, admitted_at, realm_infos, inadmissible_realms = self._redis_call(
+                self._admit_request_script,
+                args=[self.redis_prefix, config["safety_threshold"], request_uuid, config["concurrency_lease_ttl"] * 1000] + realm_cost_args
+            )
 
-                self.redis.setex(
-                    name="%s:REQUEST:%s:%s" % (self.redis_prefix, realm, request_uuid),
-                    time=self.realm_timespan(realm),
-                    value=request_uuid
-                )
+            rate_limited_realms = list(map(lambda r: r.decode("utf-8"), rate_limited_realms))
+            concurrency_limited_realms = list(map(lambda r: r.decode("utf-8"), concurrency_limited_realms))
+            inadmissible_realms = list(map(lambda r: r.decode("utf-8"), inadmissible_realms))
 
-            return request_func()
-        else:
+            self._cache_realm_limits(realms, realm_infos)
+
+            leased_realms = [realm for realm, realm_info in zip(realms, realm_infos) if realm_info[2] is not None]
+            is_admitted_locally = False
+        except RequestsRespectfulRedisError:
+            rate_limited_realms, concurrency_limited_realms, admitted_at = self._admit_request_locally(realms, realm_costs, request_uuid)
+            inadmissible_realms = self._inadmissible_realms_locally(realms, realm_costs)
+
+            leased_realms = [
+                realm for realm in realms
+                if config["redis_fallback"] == "local" and self._realm_limits[realm]["max_concurrent"] is not None
+            ]
+            is_admitted_locally = True
+
+        # Waiting without a timeout on a request that can never be admitted would never return
+        if reject_inadmissible and len(inadmissible_realms):
+            raise RequestsRespectfulError("The cost of the request can never be admitted on Realm(s): %s" % ", ".join(inadmissible_realms))
+
+        if len(rate_limited_realms):
             raise RequestsRespectfulRateLimitedError("Currently rate-limited on Realm(s): %s" % ", ".join(rate_limited_realms))
 
+        if len(concurrency_limited_realms):
+            raise RequestsRespectfulRateLimitedError("Currently at the concurrency limit on Realm(s): %s" % ", ".join(concurrency_limited_realms))
+
+        release_leases = lambda: None
+
+        # Realms without a concurrency limit don't hold a lease, nothing is renewed nor released for them
+        if len(leased_realms):
+            request_done = threading.Event()
+
+            lease_renewal = threading.Thread(
+                target=self._renew_concurrency_leases,
+                args=(leased_realms, request_uuid, request_done, is_admitted_locally)
+            )
+
+            lease_renewal.daemon = True
+            lease_renewal.start()
+
+            release_leases = lambda: self._end_concurrency_leases(leased_realms, request_uuid, request_done, is_admitted_locally)
+
+        try:
+            response = request_func()
+        except BaseException:
+            release_leases()
+            raise
+
+        # Held leases are given back by _close_response
+        if hold_leases:
+            response._respectful_release_leases = release_leases
+        else:
+            release_leases()
+
+        if callable(cost):
+            self._correct_request_cost(realms, request_uuid, admitted_at, realm_costs, self._realm_costs(realms, cost(response)), is_admitted_locally)
+
+        return response
+
+    def _correct_request_cost(self, realms, request_uuid, admitted_at, admitted_realm_costs, realm_costs, is_admitted_locally=False):
+        realm_cost_deltas = dict((realm, realm_costs[realm] - admitted_realm_costs[realm]) for realm in realms)
+
+        if is_admitted_locally:
+            return self._local_admission.correct(realms, request_uuid, admitted_at, realm_cost_deltas)
+
+        realm_cost_delta_args = list()
+
+        for realm in realms:
+            realm_cost_delta_args += [realm, realm_cost_deltas[realm]]
+
+        try:
+            self._redis_call(self._correct_request_cost_script, args=[self.redis_prefix, request_uuid, admitted_at] + realm_cost_delta_args)
+        except RequestsRespectfulRedisError:
+            pass  # The request was admitted with its initial cost, which is all that can be done without Redis
+
+    def _inadmissible_realms_locally(self, realms, realm_costs):
+        if config["redis_fallback"] != "local":
+            return list()
+
+        inadmissible_realms = list()
+
+        # Same rule as the admission script, applied to the limits scaled down by 'redis_fallback_ratio'
+        for realm in realms:
+            realm_limits = self._realm_limits.get(realm)
+
+            if realm_limits is None:
+                continue
+
+            for max_requests, timespan in [(realm_limits["max_requests"], realm_limits["timespan"])] + realm_limits["windows"]:
+                if realm_costs[realm] > int(max_requests * config["redis_fallback_ratio"]) - config["safety_threshold"]:
+                    inadmissible_realms.append(realm)
+                    break
+
+        return inadmissible_realms
+
+    def _admit_request_locally(self, realms, realm_costs, request_uuid):
+        if config["redis_fallback"] == "fail_closed":
+            raise RequestsRespectfulRedisError("The Redis server is unavailable and requests fail closed")
+
+        if config["redis_fallback"] == "fail_open":
+            return list(), list(), self._local_admission.record(realms, realm_costs, request_uuid)
+
+        unknown_realms = [realm for realm in realms if realm not in self._realm_limits]
+
+        if len(unknown_realms):
+            raise RequestsRespectfulRedisError(
+                "The Redis server is unavailable and the limits of Realm(s) %s haven't been seen yet" % ", ".join(unknown_realms)
+            )
+
+        return self._local_admission.admit(
+            realms,
+            self._realm_limits,
+            realm_costs,
+            request_uuid,
+            safety_threshold=config["safety_threshold"],
+            lease_ttl=config["concurrency_lease_ttl"] * 1000,
+            ratio=config["redis_fallback_ratio"]
+        )
+
+    def _cache_realm_limits(self, realms, realm_infos):
+        for realm, (max_requests, timespan, max_concurrent, windows) in zip(realms, realm_infos):
+            if max_requests is None:
+                continue
+
+            self._realm_limits[realm] = {
+                "max_requests": int(max_requests.decode("utf-8")),
+                "timespan": int(timespan.decode("utf-8")),
+                "max_concurrent": int(max_concurrent.decode("utf-8")) if max_concurrent is not None else None,
+                "windows": [tuple(window) for window in json.loads(windows.decode("utf-8"))] if windows is not None else list()
+            }
+
+    def _redis_call(self, func, *args, **kwargs):
+        # While Redis is unavailable, calls are only attempted again every 'redis_retry_interval' seconds
+        if self._redis_unavailable_at is not None and time.time() - self._redis_unavailable_at < config["redis_retry_interval"]:
+            raise RequestsRespectfulRedisError("The Redis server is unavailable")
+
+        try:
+            result = func(*args, **kwargs)
+        except (ConnectionError, RedisTimeoutError) as e:
+            self._redis_unavailable_at = time.time()
+            raise RequestsRespectfulRedisError("Lost the connection to the Redis server: %s" % e)
+
+        if self._redis_unavailable_at is not None:
+            self._redis_unavailable_at = None
+            self._reconcile_local_requests()
+
+        return result
+
+    def _reconcile_local_requests(self):
+        journal = self._local_admission.drain_journal()
+
+        if not len(journal):
+            return None
+
+        journal_args = list()
+
+        for realm, request_uuid, admitted_at, cost in journal:
+            journal_args += [realm, admitted_at, cost]
+
+        try:
+            self._record_requests_script(args=[self.redis_prefix] + journal_args)
+        except (ConnectionError, RedisTimeoutError):
+            self._redis_unavailable_at = time.time()
+            self._local_admission.restore_journal(journal)
+
+    @staticmethod
+    def _are_valid_windows(windows):
+        if type(windows) not in (list, tuple):
+            return False
+
+        for window in windows:
+            if type(window) not in (list, tuple) or len(window) != 2:
+                return False
+
+            if type(window[0]) != int or type(window[1]) != int or window[0] < 0 or window[1] <= 0:
+                return False
+
+        return True
+
+    @staticmethod
+    def _realm_costs(realms, cost):
+        if type(cost) == int:
+            cost = dict((realm, cost) for realm in realms)
+        elif type(cost) == dict:
+            cost = dict((realm, cost.get(realm, 1)) for realm in realms)
+        else:
+            raise RequestsRespectfulError("'cost' must be an integer, a dict of integers per realm or a callable returning either")
+
+        for realm, realm_cost in cost.items():
+            if type(realm_cost) != int or realm_cost < 0:
+                raise RequestsRespectfulError("The cost of Realm '%s' must be a non-negative integer" % realm)
+
+        return cost
+
+    def _release_concurrency_leases(self, realms, request_uuid, is_admitted_locally=False):
+        if is_admitted_locally:
+            return self._local_admission.release(realms, request_uuid)
+
+        pipeline = self.redis.pipeline()
+
+        for realm in realms:
+            pipeline.zrem("%s:LEASES:%s" % (self.redis_prefix, realm), request_uuid)
+
+        try:
+            self._redis_call(pipeline.execute)
+        except RequestsRespectfulRedisError:
+            pass  # The leases expire on their own after 'concurrency_lease_ttl' seconds
+
+    def _end_concurrency_leases(self, realms, request_uuid, request_done, is_admitted_locally=False):
+        request_done.set()
+        self._release_concurrency_leases(realms, request_uuid, is_admitted_locally)
+
+    def _renew_concurrency_leases(self, realms, request_uuid, request_done, is_admitted_locally=False):
+        lease_ttl = config["concurrency_lease_ttl"] * 1000
+
+        # Leases are renewed at half their TTL for as long as the request runs, only a crashed worker loses its slot
+        while not request_done.wait(config["concurrency_lease_ttl"] / 2.0):
+            if is_admitted_locally:
+                self._local_admission.renew(realms, request_uuid, lease_ttl)
+                continue
+
+            try:
+                self._redis_call(self._renew_concurrency_leases_script, args=[self.redis_prefix, request_uuid, lease_ttl] + list(realms))
+            except RequestsRespectfulRedisError:
+                pass  # The lease is renewed on the next attempt, if it hasn't expired by then
+
+    def _perform_admitted_request(self, request_func, realms=None, wait=False, deadline=None, cost=1, hold_leases=False):
+        if not wait:
+            return self._perform_request(request_func, realms=realms, cost=cost, hold_leases=hold_leases)
+
+        while True:
+            try:
+                return self._perform_request(
+                    request_func, realms=realms, cost=cost, hold_leases=hold_leases, reject_inadmissible=deadline is None
+                )
+            except RequestsRespectfulRateLimitedError:
+                if deadline is not None and time.time() >= deadline:
+                    raise
+
+            if deadline is None:
+                time.sleep(1)
+            else:
+                time.sleep(max(0, min(1, deadline - time.time())))
+
+    @staticmethod
+    def _close_response(response):
+        if getattr(response, "raw", None) is not None:
+            response.close()
+
+        release_leases = response.__dict__.pop("_respectful_release_leases", None)
+
+        if release_leases is not None:
+            release_leases()
+
+    def _stream_chunks(self, response, chunk_size, bandwidth_limits):
+        try:
+            yield None
+
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+
+                for realm, max_bytes_per_second in bandwidth_limits.items():
+                    try:
+                        self._redis_call(self._throttle_bandwidth, realm, max_bytes_per_second, len(chunk))
+                    except RequestsRespectfulRedisError:
+                        if config["redis_fallback"] == "fail_closed":
+                            raise
+
+                yield chunk
+        finally:
+            # Hands the connection back to the session pool and the leases back, even when the generator is abandoned
+            self._close_response(response)
+
+    def _throttle_bandwidth(self, realm, max_bytes_per_second, amount):
+        while amount > 0:
+            # Only the bytes that fit are counted in the current second, the rest is carried over to the next one
+            consumed_bytes, sleep_ms = self._throttle_bandwidth_script(args=[self.redis_prefix, realm, amount, max_bytes_per_second])
+            amount -= consumed_bytes
+
+            if amount > 0:
+                time.sleep(sleep_ms / 1000.0)
+
     def _realm_redis_key(self, realm):
         return "%s:REALMS:%s" % (self.redis_prefix, realm)
 
+    def _window_redis_key(self, realm, timespan):
+        return "%s:WINDOW:%s:%d" % (self.redis_prefix, realm, timespan)
+
+    def _realm_timespans(self, realm):
+        if not self.redis.hexists(self._realm_redis_key(realm), "max_requests"):
+            return set()
+
+        return set(timespan for max_requests, timespan in self.realm_windows(realm))
+
     def _fetch_realm_info(self, realm):
         redis_key = self._realm_redis_key(realm)
         return self.redis.hgetall(redis_key)
 
     def _requests_in_timespan(self, realm):
-        return len(
-            self.redis.scan(
-                cursor=0,
-                match="%s:REQUEST:%s:*" % (self.redis_prefix, realm),
-                count=self._redis_keys_in_db() + 100
-            )[1]
-        )
+        return self._requests_in_window(realm, self.realm_timespan(realm))
 
-    def _redis_keys_in_db(self):
-        return self.redis.info().get("db%d" % config["redis"]["database"]).get("keys")
+    def _requests_in_window(self, realm, timespan):
+        # Mirrors the bucket accounting of the admission script, see scripts.py
+        bucket_size = int(math.ceil(timespan * 1000.0 / WINDOW_BUCKETS))
+        oldest_bucket = int(time.time() * 1000) // bucket_size - WINDOW_BUCKETS
+
+        buckets = self.redis.hgetall(self._window_redis_key(realm, timespan))
+
+        return sum(int(units) for bucket, units in buckets.items() if int(bucket) >= oldest_bucket)
 
     def _can_perform_request(self, realm):
         return self._requests_in_timespan(realm) < (self.realm_max_requests(realm) - config["safety_threshold"])
@@ -212,8 +705,85 @@ class RespectfulRequester:
             raise RequestsRespectfulError("'realms' is a required kwarg")
 
         wait = kwargs.pop("wait", False)
+        wait_timeout = kwargs.pop("wait_timeout", None)
+        retry_policy = kwargs.pop("retry_policy", None)
+        cost = kwargs.pop("cost", 1)
+
+        request_func = lambda: getattr(requests, method)(*args, **kwargs)
+        request_kwargs = dict(realms=realms, wait=wait, wait_timeout=wait_timeout, retry_policy=retry_policy, cost=cost)
+
+        # Callable costs depend on each caller's response and can't be shared
+        if self.coalescer is not None and not callable(cost) and self.coalescer.is_coalescable_request(method, *args, **kwargs):
+            url = args[0] if len(args) else kwargs["url"]
+            coalesce_key = self.coalescer.coalesce_key(
+                method,
+                url,
+                params=kwargs.get("params"),
+                realms=realms,
+                cost=cost,
+                wait=wait,
+                headers=kwargs.get("headers"),
+                data=kwargs.get("data"),
+                json=kwargs.get("json"),
+                allow_redirects=kwargs.get("allow_redirects", method != "head")
+            )
+
+            # Followers don't wait on the leader past their own 'wait_timeout', they then make a single attempt
+            return self.coalescer.perform(
+                coalesce_key,
+                lambda: self._perform_proxied_request(method, args, kwargs, request_func, request_kwargs),
+                timeout=wait_timeout if wait else None,
+                fallback=lambda: self._perform_proxied_request(
+                    method, args, kwargs, request_func, dict(request_kwargs, wait=False, wait_timeout=None)
+                )
+            )
+
+        return self._perform_proxied_request(method, args, kwargs, request_func, request_kwargs)
+
+    def _perform_proxied_request(self, method, args, kwargs, request_func, request_kwargs):
+        if self.cache is not None and self.cache.is_cacheable_request(method, *args, **kwargs):
+            return self._cached_request(method, args, kwargs, request_func, request_kwargs)
+
+        return self.request(request_func, **request_kwargs)
+
+    def _cached_request(self, method, args, kwargs, request_func, request_kwargs):
+        realms = request_kwargs["realms"]
+        url = args[0] if len(args) else kwargs["url"]
+
+        cache_key = self.cache.cache_key(
+            method,
+            url,
+            params=kwargs.get("params"),
+            headers=kwargs.get("headers"),
+            data=kwargs.get("data"),
+            json=kwargs.get("json"),
+            allow_redirects=kwargs.get("allow_redirects", method != "head")
+        )
+        cache_entry = self.cache.fetch(cache_key)
+
+        if cache_entry is not None:
+            if self.cache.is_fresh(cache_entry):
+                return cache_entry["response"]
+
+            conditional_headers = self.cache.conditional_headers(cache_entry)
+
+            if len(conditional_headers):
+                # request_func closes over kwargs, so the conditional headers are picked up by the call
+                headers = dict(kwargs.get("headers") or dict())
+                headers.update(conditional_headers)
+                kwargs["headers"] = headers
+
+                if self.cache.revalidation_realms is not None:
+                    request_kwargs = dict(request_kwargs, realms=self.cache.revalidation_realms)
+
+        response = self.request(request_func, **request_kwargs)
+
+        if cache_entry is not None and response.status_code == 304:
+            return self.cache.refresh(cache_key, cache_entry, response, realms)
+
+        self.cache.store(cache_key, response, realms)
 
-        return self.request(lambda: getattr(requests, method)(*args, **kwargs), realms=realms, wait=wait)
+        return response
 
     def _requests_proxy_delete(self, *args, **kwargs):
         return self._requests_proxy("delete", *args, **kwargs)
@@ -241,7 +811,8 @@ class RespectfulRequester:
         request_func_string = inspect.getsource(request_func)
         post_lambda_string = request_func_string.split(":")[1].strip()
 
-        if not post_lambda_string.startswith(config["requests_module_name"]) and not post_lambda_string.startswith("getattr(requests"):
+        if not post_lambda_string.startswith(config["requests_module_name"]) and not post_lambda_string.startswith("getattr(requests") \
+                and not post_lambda_string.startswith("self.session."):
             raise RequestsRespectfulError("The request lambda can only contain a requests function call")
 
     @staticmethod
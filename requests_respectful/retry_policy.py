@@ -0,0 +1,73 @@
+from .exceptions import RequestsRespectfulConfigError
+
+import email.utils
+import random
+import time
+
+import requests
+
+
+class RespectfulRetryPolicy:
+
+    def __init__(self, max_attempts=3, backoff_factor=0.5, backoff_max=60, jitter=True,
+                 retry_on_status=(429, 500, 502, 503, 504),
+                 retry_on_exceptions=(requests.ConnectionError, requests.Timeout),
+                 respect_retry_after=True):
+        if type(max_attempts) != int or max_attempts < 1:
+            raise RequestsRespectfulConfigError("'max_attempts' must be a positive integer")
+
+        if not isinstance(backoff_factor, (int, float)) or backoff_factor < 0:
+            raise RequestsRespectfulConfigError("'backoff_factor' must be a positive number")
+
+        if not isinstance(backoff_max, (int, float)) or backoff_max < 0:
+            raise RequestsRespectfulConfigError("'backoff_max' must be a positive number")
+
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_on_status = tuple(retry_on_status)
+        self.retry_on_exceptions = tuple(retry_on_exceptions)
+        self.respect_retry_after = respect_retry_after
+
+    def should_retry_response(self, response):
+        return getattr(response, "status_code", None) in self.retry_on_status
+
+    def should_retry_exception(self, exception):
+        return isinstance(exception, self.retry_on_exceptions)
+
+    def backoff(self, attempt, response=None):
+        delay = min(self.backoff_max, self.backoff_factor * (2 ** (attempt - 1)))
+
+        # Full jitter: spreads retries of parallel workers over the whole backoff window
+        if self.jitter:
+            delay = random.uniform(0, delay)
+
+        if self.respect_retry_after and response is not None:
+            retry_after = self.retry_after(response)
+
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+
+        return delay
+
+    @staticmethod
+    def retry_after(response):
+        value = getattr(response, "headers", {}).get("Retry-After")
+
+        if value is None:
+            return None
+
+        value = value.strip()
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        retry_date = email.utils.parsedate_tz(value)
+
+        if retry_date is None:
+            return None
+
+        return max(0.0, email.utils.mktime_tz(retry_date) - time.time())
@@ -0,0 +1,296 @@
+# Lua scripts executed atomically by Redis
+
+# Every window of a realm is tracked in WINDOW_BUCKETS counters, no matter its timespan or its request rate
+WINDOW_BUCKETS = 60
+
+WINDOW_FUNCTIONS = """
+local function window_bucket_size(timespan)
+    return math.ceil(timespan * 1000 / %(window_buckets)d)
+end
+
+-- Sums the buckets overlapping the window and drops the ones that slid out of it. The oldest bucket
+-- is only partially covered by the window but is counted in full, which errs on the safe side
+local function window_units(window_key, timespan, now)
+    local oldest_bucket = math.floor(now / window_bucket_size(timespan)) - %(window_buckets)d
+    local buckets = redis.call("HGETALL", window_key)
+    local units = 0
+
+    for j = 1, #buckets, 2 do
+        if tonumber(buckets[j]) < oldest_bucket then
+            redis.call("HDEL", window_key, buckets[j])
+        else
+            units = units + tonumber(buckets[j + 1])
+        end
+    end
+
+    return units
+end
+
+local function record_window_units(window_key, timespan, at, units)
+    local bucket_size = window_bucket_size(timespan)
+
+    redis.call("HINCRBY", window_key, math.floor(at / bucket_size), units)
+    redis.call("PEXPIRE", window_key, timespan * 1000 + bucket_size)
+end
+
+-- The main (max_requests, timespan) limit of a realm is its first window
+local function realm_windows(max_requests, timespan, encoded_windows)
+    local windows = {{tonumber(max_requests), tonumber(timespan)}}
+
+    if encoded_windows then
+        for _, window in ipairs(cjson.decode(encoded_windows)) do
+            table.insert(windows, window)
+        end
+    end
+
+    return windows
+end
+
+local function window_redis_key(redis_prefix, realm, timespan)
+    return redis_prefix .. ":WINDOW:" .. realm .. ":" .. timespan
+end
+
+-- Windows sharing a timespan share their counters, the units are only recorded once
+local function record_realm_units(redis_prefix, realm, windows, at, units, existing_only)
+    local recorded_timespans = {}
+
+    for _, window in ipairs(windows) do
+        local window_key = window_redis_key(redis_prefix, realm, window[2])
+
+        if not recorded_timespans[window[2]] and (not existing_only or redis.call("EXISTS", window_key) == 1) then
+            record_window_units(window_key, window[2], at, units)
+        end
+
+        recorded_timespans[window[2]] = true
+    end
+end
+""" % {"window_buckets": WINDOW_BUCKETS}
+
+# ARGV: redis_prefix, safety_threshold, request_uuid, lease_ttl (ms), (realm, cost)...
+# Returns: {rate_limited_realms, concurrency_limited_realms, admitted_at (ms), realm_infos, inadmissible_realms}
+ADMIT_REQUEST = """
+redis.replicate_commands()
+""" + WINDOW_FUNCTIONS + """
+local redis_prefix = ARGV[1]
+local safety_threshold = tonumber(ARGV[2])
+local request_uuid = ARGV[3]
+local lease_ttl = tonumber(ARGV[4])
+
+local redis_time = redis.call("TIME")
+local now = tonumber(redis_time[1]) * 1000 + math.floor(tonumber(redis_time[2]) / 1000)
+
+local rate_limited_realms = {}
+local concurrency_limited_realms = {}
+local inadmissible_realms = {}
+local realm_infos = {}
+local ordered_realm_infos = {}
+
+for i = 5, #ARGV, 2 do
+    local realm = ARGV[i]
+    local cost = tonumber(ARGV[i + 1])
+    local realm_info = redis.call("HMGET", redis_prefix .. ":REALMS:" .. realm, "max_requests", "timespan", "max_concurrent", "windows")
+    local is_rate_limited = not realm_info[1]
+    local is_inadmissible = false
+
+    if realm_info[1] then
+        for _, window in ipairs(realm_windows(realm_info[1], realm_info[2], realm_info[4])) do
+            local window_key = window_redis_key(redis_prefix, realm, window[2])
+
+            if window_units(window_key, window[2], now) + cost > window[1] - safety_threshold then
+                is_rate_limited = true
+            end
+
+            -- Even an empty window can't take the request, waiting on the realm would never end
+            if cost > window[1] - safety_threshold then
+                is_inadmissible = true
+            end
+        end
+    end
+
+    if is_inadmissible then
+        table.insert(inadmissible_realms, realm)
+    end
+
+    if is_rate_limited then
+        table.insert(rate_limited_realms, realm)
+    end
+
+    if realm_info[3] then
+        local leases_key = redis_prefix .. ":LEASES:" .. realm
+
+        redis.call("ZREMRANGEBYSCORE", leases_key, "-inf", now)
+
+        if redis.call("ZCARD", leases_key) >= tonumber(realm_info[3]) then
+            table.insert(concurrency_limited_realms, realm)
+        end
+    end
+
+    realm_infos[realm] = realm_info
+    table.insert(ordered_realm_infos, realm_info)
+end
+
+if #rate_limited_realms > 0 or #concurrency_limited_realms > 0 then
+    return {rate_limited_realms, concurrency_limited_realms, now, ordered_realm_infos, inadmissible_realms}
+end
+
+for i = 5, #ARGV, 2 do
+    local realm = ARGV[i]
+    local cost = tonumber(ARGV[i + 1])
+    local realm_info = realm_infos[realm]
+
+    record_realm_units(redis_prefix, realm, realm_windows(realm_info[1], realm_info[2], realm_info[4]), now, cost, false)
+
+    if realm_info[3] then
+        local leases_key = redis_prefix .. ":LEASES:" .. realm
+
+        redis.call("ZADD", leases_key, now + lease_ttl, request_uuid)
+        redis.call("PEXPIRE", leases_key, lease_ttl)
+    end
+end
+
+return {rate_limited_realms, concurrency_limited_realms, now, ordered_realm_infos, inadmissible_realms}
+"""
+
+# ARGV: redis_prefix, request_uuid, admitted_at (ms), (realm, cost_delta)...
+CORRECT_REQUEST_COST = WINDOW_FUNCTIONS + """
+local redis_prefix = ARGV[1]
+local request_uuid = ARGV[2]
+local admitted_at = tonumber(ARGV[3])
+
+for i = 4, #ARGV, 2 do
+    local realm = ARGV[i]
+    local realm_info = redis.call("HMGET", redis_prefix .. ":REALMS:" .. realm, "max_requests", "timespan", "windows")
+
+    -- The correction lands in the bucket the request was admitted in, so it slides out of the window with it.
+    -- An expired window has nothing left to correct
+    if realm_info[1] then
+        record_realm_units(redis_prefix, realm, realm_windows(realm_info[1], realm_info[2], realm_info[3]), admitted_at, tonumber(ARGV[i + 1]), true)
+    end
+end
+
+return true
+"""
+
+# ARGV: redis_prefix, (realm, admitted_at (ms), cost)...
+RECORD_REQUESTS = WINDOW_FUNCTIONS + """
+local redis_prefix = ARGV[1]
+
+for i = 2, #ARGV, 3 do
+    local realm = ARGV[i]
+    local realm_info = redis.call("HMGET", redis_prefix .. ":REALMS:" .. realm, "max_requests", "timespan", "windows")
+
+    if realm_info[1] then
+        record_realm_units(redis_prefix, realm, realm_windows(realm_info[1], realm_info[2], realm_info[3]), tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2]), false)
+    end
+end
+
+return true
+"""
+
+# ARGV: redis_prefix, realm, amount, max_bytes_per_second
+# Returns: {the amount of bytes that fit in the current second, ms until the next second}
+THROTTLE_BANDWIDTH = """
+redis.replicate_commands()
+
+-- Windows follow the clock of the Redis server, so that all processes share the same seconds
+local redis_time = redis.call("TIME")
+local sleep_ms = 1000 - math.floor(tonumber(redis_time[2]) / 1000)
+
+local redis_key = ARGV[1] .. ":BYTES:" .. ARGV[2] .. ":" .. redis_time[1]
+local bytes_in_window = tonumber(redis.call("GET", redis_key) or 0)
+local consumed_bytes = math.min(tonumber(ARGV[3]), tonumber(ARGV[4]) - bytes_in_window)
+
+if consumed_bytes <= 0 then
+    return {0, sleep_ms}
+end
+
+redis.call("INCRBY", redis_key, consumed_bytes)
+redis.call("EXPIRE", redis_key, 2)
+
+return {consumed_bytes, sleep_ms}
+"""
+
+# ARGV: redis_prefix, request_uuid, lease_ttl (ms), realm...
+RENEW_CONCURRENCY_LEASES = """
+redis.replicate_commands()
+
+local redis_prefix = ARGV[1]
+local request_uuid = ARGV[2]
+local lease_ttl = tonumber(ARGV[3])
+
+local redis_time = redis.call("TIME")
+local now = tonumber(redis_time[1]) * 1000 + math.floor(tonumber(redis_time[2]) / 1000)
+
+for i = 4, #ARGV do
+    local leases_key = redis_prefix .. ":LEASES:" .. ARGV[i]
+
+    -- A lease that already expired may have been handed to another request, it isn't taken back
+    if redis.call("ZSCORE", leases_key, request_uuid) then
+        redis.call("ZADD", leases_key, now + lease_ttl, request_uuid)
+        redis.call("PEXPIRE", leases_key, lease_ttl)
+    end
+end
+
+return true
+"""
+
+# ARGV: redis_prefix, realm, timespan...
+# Seeds the counters of the realm's current windows from the counters of its previous windows (the given timespans)
+MIGRATE_WINDOWS = WINDOW_FUNCTIONS + """
+local redis_prefix = ARGV[1]
+local realm = ARGV[2]
+local realm_info = redis.call("HMGET", redis_prefix .. ":REALMS:" .. realm, "max_requests", "timespan", "windows")
+
+if not realm_info[1] then
+    return false
+end
+
+local previous_timespans = {}
+local current_timespans = {}
+
+for i = 3, #ARGV do
+    table.insert(previous_timespans, tonumber(ARGV[i]))
+end
+
+for _, window in ipairs(realm_windows(realm_info[1], realm_info[2], realm_info[3])) do
+    current_timespans[window[2]] = true
+end
+
+for timespan in pairs(current_timespans) do
+    local window_key = window_redis_key(redis_prefix, realm, timespan)
+
+    -- The narrowest previous window covering the new one is the most precise, otherwise the widest one covers the most
+    local source_timespan = nil
+
+    for _, previous_timespan in ipairs(previous_timespans) do
+        if previous_timespan == timespan then
+            source_timespan = nil
+            break
+        end
+
+        if source_timespan == nil
+                or (previous_timespan >= timespan and (source_timespan < timespan or previous_timespan < source_timespan))
+                or (previous_timespan < timespan and source_timespan < timespan and previous_timespan > source_timespan) then
+            source_timespan = previous_timespan
+        end
+    end
+
+    if source_timespan and redis.call("EXISTS", window_key) == 0 then
+        local source_bucket_size = window_bucket_size(source_timespan)
+        local buckets = redis.call("HGETALL", window_redis_key(redis_prefix, realm, source_timespan))
+
+        -- Units are moved to the end of their bucket, so they never slide out of the new window earlier than they should
+        for j = 1, #buckets, 2 do
+            record_window_units(window_key, timespan, (tonumber(buckets[j]) + 1) * source_bucket_size - 1, tonumber(buckets[j + 1]))
+        end
+    end
+end
+
+for _, previous_timespan in ipairs(previous_timespans) do
+    if not current_timespans[previous_timespan] then
+        redis.call("DEL", window_redis_key(redis_prefix, realm, previous_timespan))
+    end
+end
+
+return true
+"""
@@ -0,0 +1,280 @@
+from .globals import default_config
+from .exceptions import RequestsRespectfulError, RequestsRespectfulConfigError
+from .local_admission import LocalAdmission
+from .respectful_requester import RespectfulRequester
+
+import collections
+import heapq
+import itertools
+import json
+import math
+
+# Events happening at the same virtual time are processed in this order
+_COMPLETION, _ARRIVAL, _ATTEMPT = range(3)
+
+# The requester renews the leases of running requests, simulated leases are only given back on completion
+_RENEWED_LEASE_TTL = float("inf")
+
+
+class VirtualClock:
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RespectfulSimulator:
+
+    def __init__(self, realms, safety_threshold=None, concurrency=1, wait=True, wait_timeout=None, retry_interval=1,
+                 service_realms=None, service_delay=0.5):
+        if type(concurrency) != int or concurrency < 1:
+            raise RequestsRespectfulConfigError("'concurrency' must be a positive integer")
+
+        if wait_timeout is not None and (not isinstance(wait_timeout, (int, float)) or wait_timeout < 0):
+            raise RequestsRespectfulConfigError("'wait_timeout' must be a positive number")
+
+        if not isinstance(retry_interval, (int, float)) or retry_interval <= 0:
+            raise RequestsRespectfulConfigError("'retry_interval' must be a positive number")
+
+        if not isinstance(service_delay, (int, float)) or not 0 <= service_delay <= 1:
+            raise RequestsRespectfulConfigError("'service_delay' must be a number between 0 and 1")
+
+        self.realms = self._realm_limits(realms)
+        self.service_realms = self._realm_limits(service_realms) if service_realms is not None else self.realms
+        self.safety_threshold = safety_threshold if safety_threshold is not None else default_config["safety_threshold"]
+        self.concurrency = concurrency
+        self.wait = wait
+        self.wait_timeout = wait_timeout
+        self.retry_interval = retry_interval
+        self.service_delay = service_delay
+
+    @staticmethod
+    def load_trace(path):
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @classmethod
+    def sweep(cls, trace, configurations, concurrency_levels=(1,)):
+        trace = list(trace)
+        reports = list()
+
+        for configuration in configurations:
+            for concurrency in concurrency_levels:
+                report = cls(concurrency=concurrency, **configuration).run(trace)
+                report["configuration"] = configuration
+
+                reports.append(report)
+
+        return reports
+
+    def run(self, trace):
+        requests = self._parse_trace(trace)
+
+        clock = VirtualClock(requests[0]["timestamp"] if len(requests) else 0.0)
+        admission = LocalAdmission(clock=clock)
+
+        events = list()
+        sequence = itertools.count()
+
+        for index, request in enumerate(requests):
+            heapq.heappush(events, (request["timestamp"], _ARRIVAL, next(sequence), index))
+
+        queue = collections.deque()
+        idle_workers = self.concurrency
+        deadlines = dict()
+
+        admissions = list()
+        dropped = 0
+        finished_at = clock.now
+
+        while len(events):
+            clock.now, kind, _, index = heapq.heappop(events)
+            request = requests[index]
+
+            if kind == _COMPLETION:
+                admission.release(request["realms"], str(index))
+
+                idle_workers += 1
+                finished_at = clock.now
+            elif kind == _ARRIVAL:
+                queue.append(index)
+            else:
+                # Mirrors RespectfulRequester._perform_admitted_request: the worker sleeps between attempts
+                rate_limited_realms, concurrency_limited_realms, admitted_at = admission.admit(
+                    request["realms"],
+                    self.realms,
+                    request["costs"],
+                    str(index),
+                    safety_threshold=self.safety_threshold,
+                    lease_ttl=_RENEWED_LEASE_TTL
+                )
+
+                deadline = deadlines.get(index)
+
+                if not len(rate_limited_realms) and not len(concurrency_limited_realms):
+                    admissions.append((index, clock.now))
+                    heapq.heappush(events, (clock.now + request["latency"], _COMPLETION, next(sequence), index))
+                elif not self.wait or (deadline is not None and clock.now >= deadline):
+                    dropped += 1
+
+                    idle_workers += 1
+                    finished_at = clock.now
+                else:
+                    delay = self.retry_interval if deadline is None else max(0, min(self.retry_interval, deadline - clock.now))
+                    heapq.heappush(events, (clock.now + delay, _ATTEMPT, next(sequence), index))
+
+            while idle_workers and len(queue):
+                index = queue.popleft()
+
+                if self.wait_timeout is not None:
+                    deadlines[index] = clock.now + self.wait_timeout
+
+                idle_workers -= 1
+                heapq.heappush(events, (clock.now, _ATTEMPT, next(sequence), index))
+
+        started_at = requests[0]["timestamp"] if len(requests) else finished_at
+        duration = finished_at - started_at
+
+        return {
+            "concurrency": self.concurrency,
+            "requests": len(requests),
+            "admitted": len(admissions),
+            "dropped": dropped,
+            "duration": duration,
+            "throughput": len(admissions) / duration if duration > 0 else None,
+            "wait": self._distribution([admitted_at - requests[index]["timestamp"] for index, admitted_at in admissions]),
+            "violations": self._violations(requests, admissions)
+        }
+
+    def _parse_trace(self, trace):
+        requests = list()
+
+        for entry in trace:
+            if not isinstance(entry.get("timestamp"), (int, float)):
+                raise RequestsRespectfulError("Every trace entry must have a numeric 'timestamp'")
+
+            realms = entry.get("realms", [entry["realm"]] if "realm" in entry else list())
+
+            if not len(realms):
+                raise RequestsRespectfulError("Every trace entry must have a 'realm' or 'realms'")
+
+            unknown_realms = [realm for realm in realms if realm not in self.realms]
+
+            if len(unknown_realms):
+                raise RequestsRespectfulError("Realm(s) %s are not part of the simulated realms" % ", ".join(unknown_realms))
+
+            request = {
+                "timestamp": float(entry["timestamp"]),
+                "realms": realms,
+                "latency": float(entry.get("latency", 0)),
+                "costs": RespectfulRequester._realm_costs(realms, entry.get("cost", 1))
+            }
+
+            # Waiting without a timeout on such a request would keep the simulation going forever
+            for realm in (realms if self.wait and self.wait_timeout is None else list()):
+                limits = self.realms[realm]
+
+                for max_requests, timespan in [(limits["max_requests"], limits["timespan"])] + limits["windows"]:
+                    if request["costs"][realm] > max_requests - self.safety_threshold:
+                        raise RequestsRespectfulError("A request costing %d can never be admitted on Realm '%s'" % (request["costs"][realm], realm))
+
+            requests.append(request)
+
+        # Entries sharing a timestamp keep the order of the trace
+        requests.sort(key=lambda r: r["timestamp"])
+
+        return requests
+
+    def _violations(self, requests, admissions):
+        arrivals = collections.defaultdict(list)
+        visits = collections.defaultdict(list)
+
+        # The service counts a request when it receives it, 'service_delay' of its latency after it was sent
+        for index, admitted_at in admissions:
+            request = requests[index]
+            received_at = admitted_at + request["latency"] * self.service_delay
+
+            for realm in request["realms"]:
+                arrivals[realm].append((received_at, request["costs"][realm], index))
+                visits[realm].append((received_at, admitted_at + request["latency"], index))
+
+        violations = dict()
+
+        for realm, limits in self.service_realms.items():
+            violating_requests = set()
+            realm_arrivals = sorted(arrivals[realm])
+
+            for max_requests, timespan in [(limits["max_requests"], limits["timespan"])] + list(limits["windows"]):
+                window = collections.deque()
+                units = 0
+
+                for received_at, cost, index in realm_arrivals:
+                    window.append((received_at, cost))
+                    units += cost
+
+                    while window[0][0] <= received_at - timespan:
+                        units -= window.popleft()[1]
+
+                    if units > max_requests:
+                        violating_requests.add(index)
+
+            if limits["max_concurrent"] is not None:
+                in_flight = list()
+
+                for received_at, completed_at, index in sorted(visits[realm]):
+                    while len(in_flight) and in_flight[0] <= received_at:
+                        heapq.heappop(in_flight)
+
+                    heapq.heappush(in_flight, completed_at)
+
+                    if len(in_flight) > limits["max_concurrent"]:
+                        violating_requests.add(index)
+
+            violations[realm] = len(violating_requests)
+
+        return violations
+
+    @staticmethod
+    def _realm_limits(realms):
+        if type(realms) != dict:
+            raise RequestsRespectfulConfigError("'realms' must be a dict of realm limits")
+
+        realm_limits = dict()
+
+        for realm, limits in realms.items():
+            if type(limits.get("max_requests")) != int or type(limits.get("timespan")) != int or limits["timespan"] <= 0:
+                raise RequestsRespectfulConfigError("Realm '%s' must have integer 'max_requests' and 'timespan' values" % realm)
+
+            windows = limits.get("windows") or list()
+
+            if not RespectfulRequester._are_valid_windows(windows):
+                raise RequestsRespectfulConfigError("The 'windows' of Realm '%s' must be a list of (max_requests, timespan) positive integer pairs" % realm)
+
+            realm_limits[realm] = {
+                "max_requests": limits["max_requests"],
+                "timespan": limits["timespan"],
+                "max_concurrent": limits.get("max_concurrent"),
+                "windows": [tuple(window) for window in windows]
+            }
+
+        return realm_limits
+
+    @staticmethod
+    def _distribution(values):
+        if not len(values):
+            return {"mean": None, "p50": None, "p90": None, "p99": None, "max": None}
+
+        values = sorted(values)
+
+        def percentile(p):
+            return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+        return {
+            "mean": sum(values) / len(values),
+            "p50": percentile(50),
+            "p90": percentile(90),
+            "p99": percentile(99),
+            "max": values[-1]
+        }
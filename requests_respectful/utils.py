@@ -0,0 +1,69 @@
+import base64
+import hashlib
+
+import requests
+
+CREDENTIAL_HEADERS = ("authorization", "proxy-authorization", "cookie")
+
+
+def carries_credentials(kwargs):
+    if kwargs.get("auth") or kwargs.get("cookies") or kwargs.get("cert"):
+        return True
+
+    return any(header.lower() in CREDENTIAL_HEADERS for header in (kwargs.get("headers") or dict()))
+
+
+# Uploads and streamed bodies can't be read without consuming them, so they can't take part in a fingerprint
+def has_unkeyable_body(kwargs):
+    return kwargs.get("files") is not None or not isinstance(kwargs.get("data"), (type(None), str, bytes, dict, list, tuple))
+
+
+def request_fingerprint(method, url, params=None, headers=None, data=None, json=None, allow_redirects=True):
+    prepared_request = requests.Request(method.upper(), url, params=params, headers=headers, data=data, json=json).prepare()
+
+    prepared_headers = sorted(
+        "%s: %s" % (name.lower(), value.decode("utf-8") if isinstance(value, bytes) else value)
+        for name, value in prepared_request.headers.items()
+    )
+
+    body = prepared_request.body or b""
+
+    if not isinstance(body, bytes):
+        body = body.encode("utf-8")
+
+    fingerprint = hashlib.sha1(("%s %s %s\n%s\n" % (
+        prepared_request.method,
+        prepared_request.url,
+        "follow" if allow_redirects else "nofollow",
+        "\n".join(prepared_headers)
+    )).encode("utf-8"))
+
+    fingerprint.update(body)
+
+    return fingerprint
+
+
+# Responses shared through Redis are stored as JSON rather than pickled, so writing to Redis doesn't allow running code
+def serialize_response(response):
+    return {
+        "status_code": response.status_code,
+        "reason": response.reason,
+        "url": response.url,
+        "encoding": response.encoding,
+        "headers": list(response.headers.items()),
+        "content": base64.b64encode(response.content or b"").decode("ascii")
+    }
+
+
+def deserialize_response(serialized_response):
+    response = requests.Response()
+
+    response.status_code = serialized_response["status_code"]
+    response.reason = serialized_response["reason"]
+    response.url = serialized_response["url"]
+    response.encoding = serialized_response["encoding"]
+    response.headers.update(serialized_response["headers"])
+    response._content = base64.b64decode(serialized_response["content"])
+
+    return response
+
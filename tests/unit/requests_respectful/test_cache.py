@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from requests_respectful import RespectfulMemoryCache, RespectfulRedisCache, RespectfulTieredCache
+from requests_respectful import RequestsRespectfulConfigError
+
+import time
+
+import requests
+
+
+def build_response(status_code=200, headers=None, content=b"OK"):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or dict())
+    response._content = content
+
+    return response
+
+
+# Tests
+
+def test_the_cache_should_validate_provided_values():
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulMemoryCache(max_entries=0)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulMemoryCache(default_ttl=-1)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulMemoryCache(stale_ttl="FOO")
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulMemoryCache(revalidation_realms="TEST123")
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulTieredCache(tiers=[])
+
+
+def test_the_cache_should_only_consider_non_streamed_get_and_head_requests():
+    cache = RespectfulMemoryCache()
+
+    assert cache.is_cacheable_request("get", "http://google.com")
+    assert cache.is_cacheable_request("head", url="http://google.com")
+    assert not cache.is_cacheable_request("post", "http://google.com")
+    assert not cache.is_cacheable_request("get", "http://google.com", stream=True)
+
+
+def test_the_cache_should_not_consider_requests_carrying_credentials():
+    cache = RespectfulMemoryCache()
+
+    assert not cache.is_cacheable_request("get", "http://google.com", headers={"authorization": "Bearer TOKEN"})
+    assert not cache.is_cacheable_request("get", "http://google.com", auth=("user", "password"))
+    assert not cache.is_cacheable_request("get", "http://google.com", cookies={"session": "SESSION"})
+    assert cache.is_cacheable_request("get", "http://google.com", headers={"Accept": "application/json"})
+
+
+def test_the_cache_should_not_consider_requests_with_uploads_or_streamed_bodies():
+    cache = RespectfulMemoryCache()
+
+    assert not cache.is_cacheable_request("get", "http://google.com", files={"file": b"FOO"})
+    assert not cache.is_cacheable_request("get", "http://google.com", data=iter([b"FOO"]))
+    assert cache.is_cacheable_request("get", "http://google.com", data={"a": 1})
+
+
+def test_the_cache_should_generate_the_same_key_for_equivalent_requests():
+    cache = RespectfulMemoryCache()
+
+    assert cache.cache_key("get", "http://google.com/?a=1") == cache.cache_key("get", "http://google.com/", params={"a": 1})
+    assert cache.cache_key("get", "http://google.com/") != cache.cache_key("head", "http://google.com/")
+    assert cache.cache_key("get", "http://google.com/") != cache.cache_key("get", "http://google.com/", params={"a": 1})
+
+
+def test_the_cache_should_key_on_the_headers_body_and_redirects_of_the_request():
+    cache = RespectfulMemoryCache()
+    key = cache.cache_key("get", "http://google.com/", headers={"X-Api-Key": "KEY"})
+
+    assert key == cache.cache_key("get", "http://google.com/", headers={"x-api-key": "KEY"})
+    assert key != cache.cache_key("get", "http://google.com/", headers={"X-Api-Key": "OTHER"})
+    assert key != cache.cache_key("get", "http://google.com/")
+    assert key != cache.cache_key("get", "http://google.com/", headers={"X-Api-Key": "KEY"}, allow_redirects=False)
+    assert key != cache.cache_key("get", "http://google.com/", headers={"X-Api-Key": "KEY"}, data={"a": 1})
+    assert cache.cache_key("get", "http://google.com/", data={"a": 1}) != cache.cache_key("get", "http://google.com/", json={"a": 1})
+
+
+def test_the_cache_should_determine_freshness_from_the_response_headers():
+    cache = RespectfulMemoryCache(default_ttl=5)
+
+    assert cache.ttl({"Cache-Control": "public, max-age=60"}, ["TEST123"]) == 60
+    assert cache.ttl({"Cache-Control": "max-age=60, s-maxage=30"}, ["TEST123"]) == 30
+    assert cache.ttl({"Cache-Control": "no-cache"}, ["TEST123"]) == 0
+    assert cache.ttl({"Cache-Control": "no-store, max-age=60"}, ["TEST123"]) is None
+    assert cache.ttl({"Vary": "*"}, ["TEST123"]) is None
+    assert cache.ttl({"Date": "Sat, 01 Jan 2000 00:00:00 GMT", "Expires": "Sat, 01 Jan 2000 00:02:00 GMT"}, ["TEST123"]) == 120
+    assert cache.ttl(dict(), ["TEST123"]) == 5
+
+
+def test_the_cache_should_only_keep_private_responses_out_of_shared_caches():
+    assert RespectfulMemoryCache().ttl({"Cache-Control": "private, max-age=60"}, ["TEST123"]) == 60
+    assert RespectfulRedisCache().ttl({"Cache-Control": "private, max-age=60"}, ["TEST123"]) is None
+
+    tiered_cache = RespectfulTieredCache(tiers=[RespectfulMemoryCache(), RespectfulRedisCache()])
+    assert tiered_cache.ttl({"Cache-Control": "private, max-age=60"}, ["TEST123"]) is None
+
+
+def test_the_cache_should_apply_per_realm_ttl_overrides():
+    cache = RespectfulMemoryCache(realm_ttls={"TEST123": 300, "TEST234": 30})
+
+    assert cache.ttl({"Cache-Control": "max-age=60"}, ["TEST123"]) == 300
+    assert cache.ttl({"Cache-Control": "max-age=60"}, ["TEST123", "TEST234"]) == 30
+    assert cache.ttl({"Cache-Control": "max-age=60"}, ["TEST345"]) == 60
+    assert cache.ttl({"Cache-Control": "no-store"}, ["TEST123"]) is None
+
+
+def test_the_cache_should_store_and_fetch_fresh_responses():
+    cache = RespectfulMemoryCache()
+    response = build_response(headers={"Cache-Control": "max-age=60"})
+
+    cache.store("KEY", response, ["TEST123"])
+    entry = cache.fetch("KEY")
+
+    assert entry["response"] is response
+    assert cache.is_fresh(entry)
+
+    cache.store("ERROR", build_response(status_code=500, headers={"Cache-Control": "max-age=60"}), ["TEST123"])
+    assert cache.fetch("ERROR") is None
+
+
+def test_the_cache_should_keep_stale_responses_with_validators_for_revalidation():
+    cache = RespectfulMemoryCache()
+
+    cache.store("ETAG", build_response(headers={"Cache-Control": "no-cache", "ETag": '"abc"'}), ["TEST123"])
+    cache.store("PLAIN", build_response(headers={"Cache-Control": "no-cache"}), ["TEST123"])
+
+    entry = cache.fetch("ETAG")
+
+    assert not cache.is_fresh(entry)
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"abc"'}
+    assert cache.fetch("PLAIN") is None
+
+
+def test_the_cache_should_refresh_an_entry_from_a_not_modified_response():
+    cache = RespectfulMemoryCache()
+    response = build_response(headers={"Cache-Control": "no-cache", "Last-Modified": "Sat, 01 Jan 2000 00:00:00 GMT"})
+
+    cache.store("KEY", response, ["TEST123"])
+
+    refreshed_response = cache.refresh("KEY", cache.fetch("KEY"), build_response(status_code=304, headers={"Cache-Control": "max-age=60"}), ["TEST123"])
+
+    assert refreshed_response is response
+    assert refreshed_response.headers["Cache-Control"] == "max-age=60"
+    assert cache.is_fresh(cache.fetch("KEY"))
+
+
+def test_the_memory_cache_should_evict_the_least_recently_used_entries():
+    cache = RespectfulMemoryCache(max_entries=2, default_ttl=60)
+
+    cache.store("A", build_response(), ["TEST123"])
+    cache.store("B", build_response(), ["TEST123"])
+    cache.fetch("A")
+    cache.store("C", build_response(), ["TEST123"])
+
+    assert cache.fetch("A") is not None
+    assert cache.fetch("B") is None
+    assert cache.fetch("C") is not None
+
+
+def test_the_memory_cache_should_expire_entries():
+    cache = RespectfulMemoryCache()
+
+    cache.store("KEY", build_response(headers={"Cache-Control": "max-age=1"}), ["TEST123"])
+    assert cache.fetch("KEY") is not None
+
+    time.sleep(1.1)
+    assert cache.fetch("KEY") is None
+
+
+def test_the_tiered_cache_should_promote_hits_to_faster_tiers():
+    fast_tier = RespectfulMemoryCache()
+    slow_tier = RespectfulMemoryCache()
+
+    cache = RespectfulTieredCache(tiers=[fast_tier, slow_tier], default_ttl=60)
+    cache.store("KEY", build_response(), ["TEST123"])
+
+    fast_tier.clear()
+
+    assert cache.fetch("KEY") is not None
+    assert fast_tier.fetch("KEY") is not None
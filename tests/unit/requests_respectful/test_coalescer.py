@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from requests_respectful import RespectfulCoalescer
+from requests_respectful import RequestsRespectfulConfigError
+
+import threading
+import time
+
+
+def perform_concurrently(coalescer, key, func, amount=10):
+    results = list()
+    threads = [threading.Thread(target=lambda: results.append(coalescer.perform(key, func))) for _ in range(amount)]
+
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    return results
+
+
+# Tests
+
+def test_the_coalescer_should_validate_provided_values():
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulCoalescer(lock_timeout=0)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulCoalescer(poll_interval="FOO")
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulCoalescer(result_ttl=-1)
+
+
+def test_the_coalescer_should_only_consider_idempotent_non_streamed_requests():
+    coalescer = RespectfulCoalescer()
+
+    assert coalescer.is_coalescable_request("get", "http://google.com")
+    assert coalescer.is_coalescable_request("options", url="http://google.com")
+    assert not coalescer.is_coalescable_request("post", "http://google.com")
+    assert not coalescer.is_coalescable_request("get", "http://google.com", stream=True)
+
+
+def test_the_coalescer_should_not_consider_requests_carrying_credentials():
+    coalescer = RespectfulCoalescer()
+
+    assert not coalescer.is_coalescable_request("get", "http://google.com", headers={"Authorization": "Bearer TOKEN"})
+    assert not coalescer.is_coalescable_request("get", "http://google.com", auth=("user", "password"))
+    assert not coalescer.is_coalescable_request("get", "http://google.com", headers={"Cookie": "session=SESSION"})
+    assert not coalescer.is_coalescable_request("get", "http://google.com", files={"file": b"FOO"})
+
+
+def test_the_coalescer_should_generate_keys_from_the_method_url_and_params():
+    coalescer = RespectfulCoalescer()
+
+    assert coalescer.coalesce_key("get", "http://google.com/?a=1") == coalescer.coalesce_key("get", "http://google.com/", params={"a": 1})
+    assert coalescer.coalesce_key("get", "http://google.com/") != coalescer.coalesce_key("head", "http://google.com/")
+
+
+def test_the_coalescer_should_generate_different_keys_for_different_headers_bodies_and_redirects():
+    coalescer = RespectfulCoalescer()
+
+    key = coalescer.coalesce_key("get", "http://google.com/", headers={"PRIVATE-TOKEN": "TOKEN"})
+
+    assert key == coalescer.coalesce_key("get", "http://google.com/", headers={"private-token": "TOKEN"})
+    assert key != coalescer.coalesce_key("get", "http://google.com/", headers={"PRIVATE-TOKEN": "OTHER"})
+    assert key != coalescer.coalesce_key("get", "http://google.com/")
+    assert key != coalescer.coalesce_key("get", "http://google.com/", headers={"PRIVATE-TOKEN": "TOKEN"}, allow_redirects=False)
+    assert key != coalescer.coalesce_key("get", "http://google.com/", headers={"PRIVATE-TOKEN": "TOKEN"}, json={"a": 1})
+
+
+def test_the_coalescer_should_generate_different_keys_for_different_admissions():
+    coalescer = RespectfulCoalescer()
+
+    key = coalescer.coalesce_key("get", "http://google.com/", realms=["TEST123", "TEST234"], cost=1)
+
+    assert key == coalescer.coalesce_key("get", "http://google.com/", realms=["TEST234", "TEST123"], cost=1)
+    assert key != coalescer.coalesce_key("get", "http://google.com/", realms=["TEST123"], cost=1)
+    assert key != coalescer.coalesce_key("get", "http://google.com/", realms=["TEST123", "TEST234"], cost=2)
+    assert key != coalescer.coalesce_key("get", "http://google.com/", realms=["TEST123", "TEST234"], cost={"TEST123": 2})
+    assert key != coalescer.coalesce_key("get", "http://google.com/", realms=["TEST123", "TEST234"], cost=1, wait=True)
+
+
+def test_the_coalescer_should_share_a_single_call_between_concurrent_identical_requests():
+    coalescer = RespectfulCoalescer()
+    calls = list()
+
+    def func():
+        calls.append(1)
+        time.sleep(0.5)
+
+        return "RESULT"
+
+    assert perform_concurrently(coalescer, "KEY", func) == ["RESULT"] * 10
+    assert len(calls) == 1
+
+
+def test_the_coalescer_should_share_the_error_of_a_failed_call():
+    coalescer = RespectfulCoalescer()
+    errors = list()
+
+    def func():
+        time.sleep(0.5)
+        raise ValueError()
+
+    def perform():
+        try:
+            coalescer.perform("KEY", func)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=perform) for _ in range(5)]
+
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    assert len(errors) == 5
+
+
+def test_the_coalescer_should_not_share_calls_that_are_no_longer_in_flight():
+    coalescer = RespectfulCoalescer()
+    calls = list()
+
+    def func():
+        calls.append(1)
+        return len(calls)
+
+    assert coalescer.perform("KEY", func) == 1
+    assert coalescer.perform("KEY", func) == 2
+
+
+def test_the_coalescer_should_stop_waiting_on_the_leader_after_the_timeout_of_a_follower():
+    coalescer = RespectfulCoalescer()
+
+    leader = threading.Thread(target=lambda: coalescer.perform("KEY", lambda: time.sleep(1)))
+    leader.start()
+
+    time.sleep(0.1)
+
+    started_at = time.time()
+
+    assert coalescer.perform("KEY", lambda: "RESULT", timeout=0.2, fallback=lambda: "FALLBACK") == "FALLBACK"
+    assert time.time() - started_at < 0.5
+
+    leader.join()
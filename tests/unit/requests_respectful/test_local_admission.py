@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from requests_respectful.local_admission import LocalAdmission
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def realm_limits(max_requests=10, timespan=60, max_concurrent=None, windows=None):
+    return {"TEST123": {"max_requests": max_requests, "timespan": timespan, "max_concurrent": max_concurrent, "windows": windows or list()}}
+
+
+# Tests
+
+def test_the_local_admission_should_enforce_the_rate_of_a_realm():
+    clock = Clock()
+    admission = LocalAdmission(clock=clock)
+
+    for i in range(8):
+        assert admission.admit(["TEST123"], realm_limits(), {"TEST123": 1}, str(i), safety_threshold=2)[0] == list()
+
+    assert admission.admit(["TEST123"], realm_limits(), {"TEST123": 1}, "LIMITED", safety_threshold=2)[0] == ["TEST123"]
+    assert admission.units_in_window("TEST123", 60) == 8
+
+    # The oldest bucket is counted in full, the window takes up to one extra bucket to free up
+    clock.now += 60 + 1
+
+    assert admission.units_in_window("TEST123", 60) == 0
+    assert admission.admit(["TEST123"], realm_limits(), {"TEST123": 1}, "ADMITTED", safety_threshold=2)[0] == list()
+
+
+def test_the_local_admission_should_apply_the_ratio_to_the_limits():
+    admission = LocalAdmission(clock=Clock())
+
+    assert admission.admit(["TEST123"], realm_limits(), {"TEST123": 5}, "A", ratio=0.5)[0] == list()
+    assert admission.admit(["TEST123"], realm_limits(), {"TEST123": 1}, "B", ratio=0.5)[0] == ["TEST123"]
+
+
+def test_the_local_admission_should_enforce_the_windows_of_a_realm():
+    clock = Clock()
+    admission = LocalAdmission(clock=clock)
+    limits = realm_limits(max_requests=100, timespan=1, windows=[(3, 3600)])
+
+    assert admission.admit(["TEST123"], limits, {"TEST123": 3}, "A")[0] == list()
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "B")[0] == ["TEST123"]
+    assert admission.units_in_window("TEST123", 3600) == 3
+
+    clock.now += 3600 + 60
+
+    assert admission.units_in_window("TEST123", 3600) == 0
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "C")[0] == list()
+
+
+def test_the_local_admission_should_enforce_the_concurrency_of_a_realm():
+    clock = Clock()
+    admission = LocalAdmission(clock=clock)
+    limits = realm_limits(max_concurrent=1)
+
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "A", lease_ttl=1000)[1] == list()
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "B", lease_ttl=1000)[1] == ["TEST123"]
+
+    admission.release(["TEST123"], "A")
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "C", lease_ttl=1000)[1] == list()
+
+    clock.now += 1
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "D", lease_ttl=1000)[1] == list()
+
+
+def test_the_local_admission_should_renew_the_concurrency_leases_of_a_request():
+    clock = Clock()
+    admission = LocalAdmission(clock=clock)
+    limits = realm_limits(max_concurrent=1)
+
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "A", lease_ttl=1000)[1] == list()
+
+    clock.now += 0.5
+    admission.renew(["TEST123"], "A", lease_ttl=1000)
+
+    clock.now += 0.75
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "B", lease_ttl=1000)[1] == ["TEST123"]
+
+
+def test_the_local_admission_should_correct_the_cost_of_a_request():
+    admission = LocalAdmission(clock=Clock(), journal=True)
+    limits = realm_limits(windows=[(100, 3600)])
+
+    admitted_at = admission.admit(["TEST123"], limits, {"TEST123": 1}, "A")[2]
+    admission.correct(["TEST123"], "A", admitted_at, {"TEST123": 4})
+
+    assert admission.units_in_window("TEST123", 60) == 5
+    assert admission.units_in_window("TEST123", 3600) == 5
+    assert admission.drain_journal() == [("TEST123", "A", admitted_at, 5)]
+
+
+def test_the_local_admission_should_count_windows_sharing_the_timespan_of_a_realm_once():
+    admission = LocalAdmission(clock=Clock())
+    limits = realm_limits(max_requests=10, timespan=60, windows=[(5, 60)])
+
+    for i in range(5):
+        assert admission.admit(["TEST123"], limits, {"TEST123": 1}, str(i))[0] == list()
+
+    assert admission.units_in_window("TEST123", 60) == 5
+    assert admission.admit(["TEST123"], limits, {"TEST123": 1}, "LIMITED")[0] == ["TEST123"]
+
+
+def test_the_local_admission_should_journal_admitted_requests_when_asked_to():
+    admission = LocalAdmission(clock=Clock(), journal=True)
+
+    admission.admit(["TEST123"], realm_limits(max_requests=1), {"TEST123": 1}, "A")
+    admission.admit(["TEST123"], realm_limits(max_requests=1), {"TEST123": 1}, "LIMITED")
+    admission.record(["TEST123"], {"TEST123": 2}, "B")
+
+    journal = admission.drain_journal()
+
+    assert journal == [("TEST123", "A", 1000000, 1), ("TEST123", "B", 1000000, 2)]
+    assert admission.drain_journal() == list()
+
+    admission.restore_journal(journal)
+    assert admission.drain_journal() == journal
+
+    assert LocalAdmission(clock=Clock()).record(["TEST123"], {"TEST123": 1}, "C") == 1000000
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 import pytest
 
-from requests_respectful import RespectfulRequester
-from requests_respectful import RequestsRespectfulError, RequestsRespectfulConfigError, RequestsRespectfulRateLimitedError
+from requests_respectful import RespectfulRequester, RespectfulRetryPolicy
+from requests_respectful import RespectfulMemoryCache, RespectfulRedisCache, RespectfulTieredCache, RespectfulCoalescer
+from requests_respectful import RequestsRespectfulError, RequestsRespectfulConfigError, RequestsRespectfulRateLimitedError, RequestsRespectfulRedisError
 
+import io
+import json
 import redis
+import threading
+import time
 
 import requests
 import requests as r
@@ -62,6 +67,31 @@ def test_the_class_should_validate_provided_configuration_values():
 
     RespectfulRequester.configure(requests_module_name="requests")
 
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRequester.configure(concurrency_lease_ttl=0)
+
+    RespectfulRequester.configure(concurrency_lease_ttl=60)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRequester.configure(redis={"host": "localhost", "port": 6379, "database": 0, "socket_timeout": "FOO"})
+
+    RespectfulRequester.configure(redis={"host": "localhost", "port": 6379, "database": 0, "socket_timeout": 0.5, "socket_connect_timeout": 0.5})
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRequester.configure(redis_fallback="FOO")
+
+    RespectfulRequester.configure(redis_fallback="local")
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRequester.configure(redis_fallback_ratio=1.5)
+
+    RespectfulRequester.configure(redis_fallback_ratio=0.25)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRequester.configure(redis_retry_interval=0)
+
+    RespectfulRequester.configure(redis_retry_interval=1)
+
     RespectfulRequester.configure_default()
 
 
@@ -96,6 +126,7 @@ def test_the_instance_should_be_able_to_access_the_global_config():
     assert "redis" in rr._config()
     assert "safety_threshold" in rr._config()
     assert "requests_module_name" in rr._config()
+    assert "concurrency_lease_ttl" in rr._config()
 
 
 def test_the_instance_should_be_able_to_generate_a_redis_key_when_provided_with_a_realm():
@@ -492,5 +523,1154 @@ def test_the_requests_module_name_configuration_value_should_have_the_expected_e
     RespectfulRequester.configure_default()
 
 
+def test_the_instance_should_retry_retryable_responses_according_to_the_retry_policy(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    failed_response = requests.Response()
+    failed_response.status_code = 503
+
+    successful_response = requests.Response()
+    successful_response.status_code = 200
+
+    mocker.patch("requests.get", side_effect=[failed_response, failed_response, successful_response])
+
+    request_func = lambda: requests.get("http://google.com")
+    retry_policy = RespectfulRetryPolicy(max_attempts=3, backoff_factor=0)
+
+    assert rr.request(request_func, realms=["TEST123"], retry_policy=retry_policy).status_code == 200
+    assert rr._requests_in_timespan("TEST123") == 3
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_return_the_last_response_when_the_retry_policy_is_exhausted(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    failed_response = requests.Response()
+    failed_response.status_code = 503
+
+    mocker.patch("requests.get", return_value=failed_response)
+
+    retry_policy = RespectfulRetryPolicy(max_attempts=2, backoff_factor=0)
+
+    assert rr.get("http://google.com", realms=["TEST123"], retry_policy=retry_policy).status_code == 503
+    assert rr._requests_in_timespan("TEST123") == 2
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_retry_retryable_exceptions_according_to_the_retry_policy(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    mocker.patch("requests.get", side_effect=requests.ConnectionError())
+
+    request_func = lambda: requests.get("http://google.com")
+    retry_policy = RespectfulRetryPolicy(max_attempts=3, backoff_factor=0)
+
+    with pytest.raises(requests.ConnectionError):
+        rr.request(request_func, realms=["TEST123"], retry_policy=retry_policy)
+
+    assert rr._requests_in_timespan("TEST123") == 3
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_stop_waiting_once_the_wait_timeout_is_reached():
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=0, timespan=5)
+
+    request_func = lambda: requests.get("http://google.com")
+
+    started_at = time.time()
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"], wait=True, wait_timeout=1.5)
+
+    assert 1.5 <= time.time() - started_at < 3
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_serve_fresh_cached_responses_without_counting_against_realms(mocker):
+    rr = RespectfulRequester(cache=RespectfulMemoryCache())
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Cache-Control"] = "max-age=60"
+
+    requests_get = mocker.patch("requests.get", return_value=response)
+
+    assert rr.get("http://google.com", realms=["TEST123"]) is response
+    assert rr.get("http://google.com", realms=["TEST123"]) is response
+
+    assert requests_get.call_count == 1
+    assert rr._requests_in_timespan("TEST123") == 1
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_revalidate_stale_cached_responses(mocker):
+    rr = RespectfulRequester(cache=RespectfulMemoryCache())
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["ETag"] = '"abc"'
+    response.headers["Cache-Control"] = "no-cache"
+
+    not_modified_response = requests.Response()
+    not_modified_response.status_code = 304
+
+    requests_get = mocker.patch("requests.get", side_effect=[response, not_modified_response])
+
+    assert rr.get("http://google.com", realms=["TEST123"]) is response
+    assert rr.get("http://google.com", realms=["TEST123"]) is response
+
+    assert requests_get.call_args[1]["headers"]["If-None-Match"] == '"abc"'
+    assert rr._requests_in_timespan("TEST123") == 2
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_count_revalidations_against_the_revalidation_realms_when_provided(mocker):
+    rr = RespectfulRequester(cache=RespectfulMemoryCache(revalidation_realms=["TEST234"]))
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+    rr.register_realm("TEST234", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["ETag"] = '"abc"'
+    response.headers["Cache-Control"] = "no-cache"
+
+    not_modified_response = requests.Response()
+    not_modified_response.status_code = 304
+
+    mocker.patch("requests.get", side_effect=[response, not_modified_response])
+
+    rr.get("http://google.com", realms=["TEST123"])
+    rr.get("http://google.com", realms=["TEST123"])
+
+    assert rr._requests_in_timespan("TEST123") == 1
+    assert rr._requests_in_timespan("TEST234") == 1
+
+    rr.unregister_realm("TEST123")
+    rr.unregister_realm("TEST234")
+
+
+def test_the_redis_cache_should_share_cached_responses_between_instances():
+    cache = RespectfulRedisCache(default_ttl=60)
+    rr = RespectfulRequester(cache=cache)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "text/plain"
+    response._content = b"CACHED"
+
+    cache.store("KEY", response, ["TEST123"])
+
+    cached_response = RespectfulRedisCache(redis=rr.redis).fetch("KEY")["response"]
+
+    assert cached_response.status_code == 200
+    assert cached_response.headers["content-type"] == "text/plain"
+    assert cached_response.content == b"CACHED"
+    assert rr.redis.pttl("%s:CACHE:KEY" % rr.redis_prefix) > 0
+
+    # Entries are stored as JSON, never unpickled
+    assert json.loads(rr.redis.get("%s:CACHE:KEY" % rr.redis_prefix).decode("utf-8"))["response"]["status_code"] == 200
+
+    cache.clear()
+
+    assert cache.fetch("KEY") is None
+
+
+def test_the_instance_should_coalesce_concurrent_identical_requests(mocker):
+    rr = RespectfulRequester(coalescer=RespectfulCoalescer())
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+
+    def slow_get(*args, **kwargs):
+        time.sleep(0.5)
+        return response
+
+    requests_get = mocker.patch("requests.get", side_effect=slow_get)
+
+    responses = list()
+    threads = [threading.Thread(target=lambda: responses.append(rr.get("http://google.com", realms=["TEST123"]))) for _ in range(5)]
+
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    assert responses == [response] * 5
+    assert requests_get.call_count == 1
+    assert rr._requests_in_timespan("TEST123") == 1
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_coalesce_concurrent_identical_requests_across_processes(mocker):
+    leader = RespectfulRequester(coalescer=RespectfulCoalescer(distributed=True))
+    follower = RespectfulRequester(coalescer=RespectfulCoalescer(distributed=True))
+
+    leader.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"COALESCED"
+
+    def slow_get(*args, **kwargs):
+        time.sleep(0.5)
+        return response
+
+    requests_get = mocker.patch("requests.get", side_effect=slow_get)
+
+    responses = list()
+    threads = [
+        threading.Thread(target=lambda: responses.append(leader.get("http://google.com", realms=["TEST123"]))),
+        threading.Thread(target=lambda: responses.append(follower.get("http://google.com", realms=["TEST123"])))
+    ]
+
+    threads[0].start()
+    time.sleep(0.1)
+    threads[1].start()
+
+    [thread.join() for thread in threads]
+
+    assert [r.content for r in responses] == [b"COALESCED"] * 2
+    assert [r.status_code for r in responses] == [200] * 2
+    assert requests_get.call_count == 1
+    assert leader._requests_in_timespan("TEST123") == 1
+
+    # Results are published as JSON, never unpickled
+    result_keys = leader.redis.keys("%s:COALESCE:*:RESULT:*" % leader.redis_prefix)
+
+    assert len(result_keys) == 1
+    assert json.loads(leader.redis.get(result_keys[0]).decode("utf-8"))["status_code"] == 200
+
+    leader.unregister_realm("TEST123")
+
+
+def test_the_instance_should_be_able_to_register_a_realm_with_a_bandwidth_limit():
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_bytes_per_second=1000)
+    rr.register_realm("TEST234", max_requests=100, timespan=300)
+
+    assert rr.realm_max_bytes_per_second("TEST123") == 1000
+    assert rr.realm_max_bytes_per_second("TEST234") is None
+
+    rr.update_realm("TEST123", max_bytes_per_second=5000)
+    assert rr.realm_max_bytes_per_second("TEST123") == 5000
+
+    rr.unregister_realm("TEST123")
+    rr.unregister_realm("TEST234")
+
+
+def test_the_instance_should_stream_responses_in_chunks_and_release_the_connection(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(b"x" * 3000)
+
+    mocker.patch.object(rr.session, "request", return_value=response)
+    response_close = mocker.spy(response, "close")
+
+    chunks = list(rr.stream("get", "http://google.com", realms=["TEST123"], chunk_size=1000))
+
+    assert chunks == [b"x" * 1000] * 3
+    assert response_close.call_count == 1
+    assert rr._requests_in_timespan("TEST123") == 1
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_enforce_the_bandwidth_limit_while_streaming(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_bytes_per_second=1000)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(b"x" * 3000)
+
+    mocker.patch.object(rr.session, "request", return_value=response)
+
+    started_at = time.time()
+
+    assert len(b"".join(rr.stream("get", "http://google.com", realms=["TEST123"], chunk_size=500))) == 3000
+    assert time.time() - started_at >= 1
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_be_able_to_register_a_realm_with_a_concurrency_limit():
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_concurrent=2)
+    rr.register_realm("TEST234", max_requests=100, timespan=300)
+
+    assert rr.realm_max_concurrent("TEST123") == 2
+    assert rr.realm_max_concurrent("TEST234") is None
+
+    rr.update_realm("TEST123", max_concurrent=5)
+    assert rr.realm_max_concurrent("TEST123") == 5
+
+    rr.unregister_realm("TEST123")
+    rr.unregister_realm("TEST234")
+
+
+def test_the_instance_should_enforce_the_concurrency_limit_until_the_request_completes(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_concurrent=1)
+
+    response = requests.Response()
+    response.status_code = 200
+
+    request_func = lambda: requests.get("http://google.com")
+
+    def nested_get(*args, **kwargs):
+        with pytest.raises(RequestsRespectfulRateLimitedError):
+            rr._perform_request(request_func, realms=["TEST123"])
+
+        return response
+
+    mocker.patch("requests.get", side_effect=nested_get)
+    assert rr._perform_request(request_func, realms=["TEST123"]) is response
+
+    mocker.patch("requests.get", side_effect=requests.ConnectionError())
+
+    with pytest.raises(requests.ConnectionError):
+        rr._perform_request(request_func, realms=["TEST123"])
+
+    mocker.patch("requests.get", return_value=response)
+    assert rr._perform_request(request_func, realms=["TEST123"]) is response
+
+    assert rr.redis.zcard("%s:LEASES:TEST123" % rr.redis_prefix) == 0
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_expire_the_concurrency_leases_of_crashed_workers(mocker):
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(concurrency_lease_ttl=1)
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_concurrent=1)
+
+    # Acquires a lease that is never released
+    rr._admit_request_script(args=[rr.redis_prefix, 0, "CRASHED", 1000, "TEST123", 1])
+
+    request_func = lambda: requests.get("http://google.com")
+    mocker.patch("requests.get", return_value=requests.Response())
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr._perform_request(request_func, realms=["TEST123"])
+
+    time.sleep(1.1)
+
+    rr._perform_request(request_func, realms=["TEST123"])
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_consume_the_cost_of_a_request_on_its_realms():
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(safety_threshold=0)
+
+    rr.register_realm("TEST123", max_requests=10, timespan=300)
+    rr.register_realm("TEST234", max_requests=10, timespan=300)
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123", "TEST234"], cost=4)
+    rr.request(request_func, realms=["TEST123", "TEST234"], cost={"TEST123": 5})
+
+    assert rr._requests_in_timespan("TEST123") == 9
+    assert rr._requests_in_timespan("TEST234") == 5
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"], cost=2)
+
+    rr.request(request_func, realms=["TEST123"], cost=1)
+
+    rr.unregister_realm("TEST123")
+    rr.unregister_realm("TEST234")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_validate_the_cost_of_a_request():
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=10, timespan=300)
+
+    request_func = lambda: requests.get("http://google.com")
+
+    with pytest.raises(RequestsRespectfulError):
+        rr.request(request_func, realms=["TEST123"], cost=-1)
+
+    with pytest.raises(RequestsRespectfulError):
+        rr.request(request_func, realms=["TEST123"], cost="FOO")
+
+    with pytest.raises(RequestsRespectfulError):
+        rr.request(request_func, realms=["TEST123"], cost={"TEST123": 1.5})
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_correct_the_cost_of_a_request_from_its_response(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["X-Cost"] = "25"
+
+    mocker.patch("requests.get", return_value=response)
+
+    rr.get("http://google.com", realms=["TEST123"], cost=lambda r: int(r.headers["X-Cost"]))
+
+    assert rr._requests_in_timespan("TEST123") == 25
+    assert rr.redis.ttl("%s:WINDOW:TEST123:300" % rr.redis_prefix) > 0
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_be_able_to_register_a_realm_with_multiple_windows():
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=10, timespan=1, windows=[(5000, 3600), (50000, 86400)])
+    rr.register_realm("TEST234", max_requests=10, timespan=1)
+
+    assert rr.realm_windows("TEST123") == [(10, 1), (5000, 3600), (50000, 86400)]
+    assert rr.realm_windows("TEST234") == [(10, 1)]
+
+    rr.update_realm("TEST123", windows=[(1000, 60)])
+    assert rr.realm_windows("TEST123") == [(10, 1), (1000, 60)]
+
+    rr.update_realm("TEST123", windows="FOO")
+    assert rr.realm_windows("TEST123") == [(10, 1), (1000, 60)]
+
+    rr.update_realm("TEST123", windows=[])
+    assert rr.realm_windows("TEST123") == [(10, 1)]
+
+    with pytest.raises(RequestsRespectfulError):
+        rr.register_realm("TEST345", max_requests=10, timespan=1, windows=[(5000, "BAR")])
+
+    rr.unregister_realm("TEST123")
+    rr.unregister_realm("TEST234")
+
+
+def test_the_instance_should_enforce_every_window_of_a_realm():
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(safety_threshold=0)
+
+    rr.register_realm("TEST123", max_requests=100, timespan=1, windows=[(3, 3600)])
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123"])
+    rr.request(request_func, realms=["TEST123"], cost=2)
+
+    assert rr._requests_in_timespan("TEST123") == 3
+    assert rr._requests_in_window("TEST123", 3600) == 3
+    assert len(rr.redis.hkeys("%s:WINDOW:TEST123:3600" % rr.redis_prefix)) == 1
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"])
+
+    rr.update_realm("TEST123", windows=[(4, 3600)])
+    rr.request(request_func, realms=["TEST123"])
+
+    rr.unregister_realm("TEST123")
+
+    assert not len(rr.redis.keys("%s:WINDOW:TEST123:*" % rr.redis_prefix))
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_slide_the_windows_of_a_realm():
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(safety_threshold=0)
+
+    rr.register_realm("TEST123", max_requests=100, timespan=1, windows=[(1, 2)])
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123"])
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"])
+
+    # The oldest bucket is counted in full, the window can take up to one extra bucket to free up
+    time.sleep(2.1)
+
+    rr.request(request_func, realms=["TEST123"])
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_correct_the_cost_of_a_request_in_every_window(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, windows=[(1000, 3600)])
+
+    response = requests.Response()
+    response.status_code = 200
+
+    mocker.patch("requests.get", return_value=response)
+
+    rr.get("http://google.com", realms=["TEST123"], cost=lambda r: 25)
+
+    assert rr._requests_in_timespan("TEST123") == 25
+    assert rr._requests_in_window("TEST123", 3600) == 25
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_fail_closed_when_redis_is_unavailable(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    mocker.patch.object(redis.StrictRedis, "execute_command", side_effect=redis.ConnectionError("Unavailable"))
+
+    with pytest.raises(RequestsRespectfulRedisError):
+        rr.get("http://google.com", realms=["TEST123"])
+
+    with pytest.raises(RequestsRespectfulRedisError):
+        RespectfulRequester()
+
+    mocker.stopall()
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_fail_open_when_redis_is_unavailable_and_reconcile_once_it_is_back(mocker):
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(redis_fallback="fail_open", redis_retry_interval=0.5)
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    mocker.patch.object(redis.StrictRedis, "execute_command", side_effect=redis.ConnectionError("Unavailable"))
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123"])
+    rr.request(request_func, realms=["TEST123"])
+
+    mocker.stopall()
+    time.sleep(0.5)
+
+    rr.request(request_func, realms=["TEST123"], cost=0)
+
+    assert rr._requests_in_timespan("TEST123") == 2
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_limit_requests_locally_when_redis_is_unavailable_and_reconcile_once_it_is_back(mocker):
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(safety_threshold=0, redis_fallback="local", redis_fallback_ratio=0.5, redis_retry_interval=0.5)
+
+    rr.register_realm("TEST123", max_requests=10, timespan=300)
+    rr.register_realm("TEST234", max_requests=10, timespan=300)
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123"])
+
+    mocker.patch.object(redis.StrictRedis, "execute_command", side_effect=redis.ConnectionError("Unavailable"))
+
+    for _ in range(5):
+        rr.request(request_func, realms=["TEST123"])
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"])
+
+    # The limits of realms that were never admitted through Redis are unknown
+    with pytest.raises(RequestsRespectfulRedisError):
+        rr.request(request_func, realms=["TEST234"])
+
+    mocker.stopall()
+    time.sleep(0.5)
+
+    rr.request(request_func, realms=["TEST123"])
+
+    assert rr._requests_in_timespan("TEST123") == 7
+
+    rr.unregister_realm("TEST123")
+    rr.unregister_realm("TEST234")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_not_block_on_redis_while_it_is_unavailable(mocker):
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(redis_fallback="fail_open", redis_retry_interval=60)
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    execute_command = mocker.patch.object(redis.StrictRedis, "execute_command", side_effect=redis.ConnectionError("Unavailable"))
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123"])
+    call_count = execute_command.call_count
+
+    rr.request(request_func, realms=["TEST123"])
+    rr.request(request_func, realms=["TEST123"])
+
+    assert execute_command.call_count == call_count
+
+    mocker.stopall()
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_keep_a_fixed_amount_of_redis_keys_per_realm():
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(safety_threshold=0)
+
+    rr.register_realm("TEST123", max_requests=1000, timespan=300, windows=[(1000, 300), (5000, 3600)])
+
+    request_func = lambda: requests.get("http://google.com")
+
+    for i in range(50):
+        rr.request(request_func, realms=["TEST123"])
+
+    assert rr._requests_in_timespan("TEST123") == 50
+    assert rr._requests_in_window("TEST123", 3600) == 50
+    assert not len(rr.redis.keys("%s:REQUEST:TEST123:*" % rr.redis_prefix))
+    assert len(rr.redis.keys("%s:WINDOW:TEST123:*" % rr.redis_prefix)) == 2
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_report_the_memory_usage_of_a_realm():
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100000, timespan=3600)
+
+    assert rr.memory_usage("TEST234") == 0
+
+    initial_memory_usage = rr.memory_usage("TEST123")
+    assert initial_memory_usage > 0
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123"])
+    memory_usage = rr.memory_usage("TEST123")
+
+    assert memory_usage > initial_memory_usage
+
+    for i in range(100):
+        rr.request(request_func, realms=["TEST123"])
+
+    # Requests made within the same bucket only increment its counter
+    assert rr.memory_usage("TEST123") < memory_usage + 1024
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_close_the_responses_discarded_by_the_retry_policy(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    failed_response = requests.Response()
+    failed_response.status_code = 503
+    failed_response.raw = io.BytesIO(b"")
+
+    successful_response = requests.Response()
+    successful_response.status_code = 200
+    successful_response.raw = io.BytesIO(b"")
+
+    mocker.patch("requests.get", side_effect=[failed_response, successful_response])
+    mocker.spy(failed_response, "close")
+    mocker.spy(successful_response, "close")
+
+    request_func = lambda: requests.get("http://google.com")
+    retry_policy = RespectfulRetryPolicy(max_attempts=3, backoff_factor=0)
+
+    assert rr.request(request_func, realms=["TEST123"], retry_policy=retry_policy).status_code == 200
+
+    assert failed_response.close.call_count == 1
+    assert successful_response.close.call_count == 0
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_not_cache_responses_to_requests_carrying_credentials(mocker):
+    rr = RespectfulRequester(cache=RespectfulRedisCache(default_ttl=60))
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+
+    requests_get = mocker.patch("requests.get", return_value=response)
+
+    rr.get("http://google.com", realms=["TEST123"], headers={"Authorization": "Bearer TOKEN"})
+    rr.get("http://google.com", realms=["TEST123"], headers={"Authorization": "Bearer OTHER"})
+
+    assert requests_get.call_count == 2
+    assert not len(rr.redis.keys("%s:CACHE:*" % rr.redis_prefix))
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_not_coalesce_requests_made_with_different_credentials_or_realms(mocker):
+    rr = RespectfulRequester(coalescer=RespectfulCoalescer())
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+    rr.register_realm("TEST234", max_requests=100, timespan=300)
+
+    def slow_get(*args, **kwargs):
+        time.sleep(0.3)
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = (kwargs.get("headers") or dict()).get("Authorization", "ANONYMOUS").encode("utf-8")
+
+        return response
+
+    requests_get = mocker.patch("requests.get", side_effect=slow_get)
+
+    responses = dict()
+    calls = [
+        ("A", lambda: rr.get("http://google.com", realms=["TEST123"], headers={"Authorization": "A"})),
+        ("B", lambda: rr.get("http://google.com", realms=["TEST123"], headers={"Authorization": "B"})),
+        ("C", lambda: rr.get("http://google.com", realms=["TEST123"])),
+        ("D", lambda: rr.get("http://google.com", realms=["TEST234"]))
+    ]
+
+    threads = [threading.Thread(target=lambda name=name, call=call: responses.__setitem__(name, call())) for name, call in calls]
+
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    assert responses["A"].content == b"A"
+    assert responses["B"].content == b"B"
+    assert requests_get.call_count == 4
+    assert rr._requests_in_timespan("TEST123") == 3
+    assert rr._requests_in_timespan("TEST234") == 1
+
+    rr.unregister_realm("TEST123")
+    rr.unregister_realm("TEST234")
+
+
+def test_the_instance_should_only_count_the_bytes_that_fit_in_each_second_of_the_bandwidth_limit(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_bytes_per_second=1000)
+
+    counted_bytes = list()
+    throttle_bandwidth_script = rr._throttle_bandwidth_script
+
+    def counting_throttle_bandwidth_script(args):
+        result = throttle_bandwidth_script(args=args)
+        counted_bytes.append(max(int(rr.redis.get(key)) for key in rr.redis.keys("%s:BYTES:TEST123:*" % rr.redis_prefix)))
+
+        return result
+
+    mocker.patch.object(rr, "_throttle_bandwidth_script", side_effect=counting_throttle_bandwidth_script)
+
+    rr._throttle_bandwidth("TEST123", 1000, 3000)
+
+    # 3000 bytes spread over 3 seconds, never counted twice
+    assert len(counted_bytes) >= 3
+    assert set(counted_bytes) == {1000}
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_not_release_leases_on_realms_without_a_concurrency_limit(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    mocker.patch("requests.get", return_value=requests.Response())
+    pipeline = mocker.spy(rr.redis, "pipeline")
+
+    rr.get("http://google.com", realms=["TEST123"])
+
+    assert pipeline.call_count == 0
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_renew_the_concurrency_leases_of_long_running_requests(mocker):
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(concurrency_lease_ttl=1)
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_concurrent=1)
+
+    def slow_get(*args, **kwargs):
+        time.sleep(2)
+        return requests.Response()
+
+    mocker.patch("requests.get", side_effect=slow_get)
+
+    thread = threading.Thread(target=lambda: rr.get("http://google.com", realms=["TEST123"]))
+    thread.start()
+
+    # The lease TTL is long gone, but the request is still running
+    time.sleep(1.5)
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.get("http://google.com", realms=["TEST123"])
+
+    thread.join()
+
+    assert not rr.redis.zcard("%s:LEASES:TEST123" % rr.redis_prefix)
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_refuse_to_wait_on_a_request_that_can_never_be_admitted(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=1, windows=[(15, 3600)])
+
+    # The admission script tells inadmissible requests apart, the realm isn't looked up separately
+    realm_windows = mocker.spy(rr, "realm_windows")
+
+    request_func = lambda: requests.get("http://google.com")
+
+    with pytest.raises(RequestsRespectfulError):
+        rr.request(request_func, realms=["TEST123"], wait=True, cost=6)
+
+    with pytest.raises(RequestsRespectfulError):
+        rr.get("http://google.com", realms=["TEST123"], wait=True, cost={"TEST123": 10})
+
+    assert rr._requests_in_timespan("TEST123") == 0
+
+    rr.request(request_func, realms=["TEST123"], wait=True, cost=5)
+
+    # A timeout bounds the wait, the request is simply rate-limited
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"], wait=True, wait_timeout=0.1, cost=6)
+
+    assert realm_windows.call_count == 0
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_skip_the_redis_cache_and_coalescing_when_redis_is_unavailable(mocker):
+    cache = RespectfulTieredCache(tiers=[RespectfulMemoryCache(), RespectfulRedisCache()], default_ttl=60)
+    rr = RespectfulRequester(cache=cache, coalescer=RespectfulCoalescer(distributed=True))
+
+    RespectfulRequester.configure(redis_fallback="fail_open")
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+
+    requests_get = mocker.patch("requests.get", return_value=response)
+    mocker.patch.object(redis.StrictRedis, "execute_command", side_effect=redis.ConnectionError("Unavailable"))
+
+    assert rr.get("http://google.com", realms=["TEST123"]) is response
+
+    # The in-process tier still serves hits
+    assert rr.get("http://google.com", realms=["TEST123"]) is response
+    assert requests_get.call_count == 1
+
+    mocker.stopall()
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_carry_the_rate_count_of_a_realm_over_to_its_updated_windows():
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(safety_threshold=10)
+
+    rr.register_realm("TEST123", max_requests=15, timespan=60)
+
+    request_func = lambda: requests.get("http://google.com")
+
+    for i in range(5):
+        rr.request(request_func, realms=["TEST123"])
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"])
+
+    rr.update_realm("TEST123", timespan=120)
+
+    assert rr._requests_in_timespan("TEST123") == 5
+    assert not rr.redis.exists("%s:WINDOW:TEST123:60" % rr.redis_prefix)
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"])
+
+    rr.update_realm("TEST123", windows=[(15, 3600)])
+
+    assert rr._requests_in_window("TEST123", 3600) == 5
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"])
+
+    rr.update_realm("TEST123", timespan=30, windows=[])
+
+    assert rr._requests_in_timespan("TEST123") == 5
+    assert rr.redis.keys("%s:WINDOW:TEST123:*" % rr.redis_prefix) == [("%s:WINDOW:TEST123:30" % rr.redis_prefix).encode("utf-8")]
+
+    rr.unregister_realm("TEST123")
+
+    RespectfulRequester.configure_default()
+
+
+def test_the_instance_should_only_delete_the_keys_of_the_unregistered_realm():
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=60, windows=[(1000, 3600)])
+    rr.register_realm("TEST123:X", max_requests=100, timespan=60)
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123", "TEST123:X"])
+
+    rr.unregister_realm("TEST123")
+
+    assert not rr.redis.exists("%s:WINDOW:TEST123:60" % rr.redis_prefix)
+    assert not rr.redis.exists("%s:WINDOW:TEST123:3600" % rr.redis_prefix)
+    assert rr._requests_in_timespan("TEST123:X") == 1
+
+    rr.unregister_realm("TEST123:X")
+
+    assert not len(rr.redis.keys("%s:WINDOW:*" % rr.redis_prefix))
+
+
+def test_the_instance_should_not_share_cached_responses_between_requests_with_different_headers(mocker):
+    rr = RespectfulRequester(cache=RespectfulMemoryCache(default_ttl=60))
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    def get(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = kwargs["headers"]["X-Api-Key"].encode("utf-8")
+
+        return response
+
+    requests_get = mocker.patch("requests.get", side_effect=get)
+
+    assert rr.get("http://google.com", realms=["TEST123"], headers={"X-Api-Key": "KEY"}).content == b"KEY"
+    assert rr.get("http://google.com", realms=["TEST123"], headers={"X-Api-Key": "OTHER"}).content == b"OTHER"
+    assert rr.get("http://google.com", realms=["TEST123"], headers={"X-Api-Key": "KEY"}).content == b"KEY"
+
+    assert requests_get.call_count == 2
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_not_make_coalesced_requests_wait_past_their_own_wait_timeout(mocker):
+    rr = RespectfulRequester(coalescer=RespectfulCoalescer())
+
+    rr.register_realm("TEST123", max_requests=11, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+
+    mocker.patch("requests.get", return_value=response)
+
+    rr.get("http://google.com", realms=["TEST123"])
+
+    # The leader waits on the rate-limited realm for up to 2 seconds
+    leader = threading.Thread(target=lambda: pytest.raises(
+        RequestsRespectfulRateLimitedError, rr.get, "http://google.com", realms=["TEST123"], wait=True, wait_timeout=2
+    ))
+    leader.start()
+
+    time.sleep(0.1)
+
+    started_at = time.time()
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.get("http://google.com", realms=["TEST123"], wait=True, wait_timeout=0.3)
+
+    assert time.time() - started_at < 1
+
+    started_at = time.time()
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.get("http://google.com", realms=["TEST123"])
+
+    assert time.time() - started_at < 0.5
+
+    leader.join()
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_check_streamed_requests_before_the_first_chunk(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=11, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 404
+    response.raw = io.BytesIO(b"x" * 3000)
+
+    session_request = mocker.patch.object(rr.session, "request", return_value=response)
+    response_close = mocker.spy(response, "close")
+
+    with pytest.raises(RequestsRespectfulError):
+        rr.stream("get", "http://google.com")
+
+    with pytest.raises(requests.HTTPError):
+        rr.stream("get", "http://google.com", realms=["TEST123"])
+
+    assert response_close.call_count == 1
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.stream("get", "http://google.com", realms=["TEST123"])
+
+    assert session_request.call_count == 1
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_close_streamed_responses_that_are_never_iterated(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(b"x" * 3000)
+
+    mocker.patch.object(rr.session, "request", return_value=response)
+    response_close = mocker.spy(response, "close")
+
+    rr.stream("get", "http://google.com", realms=["TEST123"]).close()
+
+    assert response_close.call_count == 1
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_follow_the_clock_of_the_redis_server_for_bandwidth_windows(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_bytes_per_second=1000)
+
+    server_second = rr.redis.time()[0]
+
+    mocker.patch("time.time", return_value=server_second - 3600.0)
+
+    rr._throttle_bandwidth("TEST123", 1000, 500)
+
+    mocker.stopall()
+
+    windows = [int(key.decode("utf-8").split(":")[-1]) for key in rr.redis.keys("%s:BYTES:TEST123:*" % rr.redis_prefix)]
+
+    assert len(windows) == 1
+    assert abs(windows[0] - server_second) <= 1
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_hold_the_concurrency_leases_of_streamed_responses_until_they_are_closed(mocker):
+    rr = RespectfulRequester()
+
+    rr.register_realm("TEST123", max_requests=100, timespan=300, max_concurrent=1)
+
+    def stream_request(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(b"x" * 3000)
+
+        return response
+
+    mocker.patch.object(rr.session, "request", side_effect=stream_request)
+
+    chunks = rr.stream("get", "http://google.com", realms=["TEST123"], chunk_size=1000)
+    next(chunks)
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.stream("get", "http://google.com", realms=["TEST123"])
+
+    assert len(list(chunks)) == 2
+    assert rr.redis.zcard("%s:LEASES:TEST123" % rr.redis_prefix) == 0
+
+    rr.stream("get", "http://google.com", realms=["TEST123"]).close()
+
+    assert rr.redis.zcard("%s:LEASES:TEST123" % rr.redis_prefix) == 0
+
+    rr.unregister_realm("TEST123")
+
+
+def test_the_instance_should_apply_the_safety_threshold_to_the_local_limits_when_redis_is_unavailable(mocker):
+    rr = RespectfulRequester()
+
+    RespectfulRequester.configure(safety_threshold=10, redis_fallback="local", redis_fallback_ratio=0.5, redis_retry_interval=60)
+
+    rr.register_realm("TEST123", max_requests=40, timespan=300)
+
+    request_func = lambda: requests.get("http://google.com")
+
+    rr.request(request_func, realms=["TEST123"])
+
+    mocker.patch.object(redis.StrictRedis, "execute_command", side_effect=redis.ConnectionError("Unavailable"))
+
+    # 40 requests scaled down to 20, minus the safety threshold of 10
+    with pytest.raises(RequestsRespectfulError):
+        rr.request(request_func, realms=["TEST123"], wait=True, cost=11)
+
+    rr.request(request_func, realms=["TEST123"], wait=True, cost=10)
+
+    with pytest.raises(RequestsRespectfulRateLimitedError):
+        rr.request(request_func, realms=["TEST123"])
+
+    mocker.stopall()
+
+    RespectfulRequester.configure_default()
+
+    rr.unregister_realm("TEST123")
+
+
 def test_teardown():
     pass
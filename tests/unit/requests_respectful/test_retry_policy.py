@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from requests_respectful import RespectfulRetryPolicy
+from requests_respectful import RequestsRespectfulConfigError
+
+import email.utils
+import time
+
+import requests
+
+
+def build_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or dict())
+
+    return response
+
+
+# Tests
+
+def test_the_policy_should_validate_provided_values():
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRetryPolicy(max_attempts=0)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRetryPolicy(max_attempts="FOO")
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRetryPolicy(backoff_factor=-1)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulRetryPolicy(backoff_max="BAR")
+
+
+def test_the_policy_should_recognize_retryable_responses():
+    policy = RespectfulRetryPolicy(retry_on_status=[500, 503])
+
+    assert policy.should_retry_response(build_response(503))
+    assert not policy.should_retry_response(build_response(200))
+    assert not policy.should_retry_response(build_response(429))
+
+
+def test_the_policy_should_recognize_retryable_exceptions():
+    policy = RespectfulRetryPolicy()
+
+    assert policy.should_retry_exception(requests.ConnectionError())
+    assert policy.should_retry_exception(requests.Timeout())
+    assert not policy.should_retry_exception(ValueError())
+
+
+def test_the_policy_should_back_off_exponentially_up_to_a_maximum():
+    policy = RespectfulRetryPolicy(backoff_factor=1, backoff_max=5, jitter=False)
+
+    assert policy.backoff(1) == 1
+    assert policy.backoff(2) == 2
+    assert policy.backoff(3) == 4
+    assert policy.backoff(4) == 5
+
+
+def test_the_policy_should_apply_jitter_within_the_backoff_window():
+    policy = RespectfulRetryPolicy(backoff_factor=1, backoff_max=5, jitter=True)
+
+    for _ in range(100):
+        assert 0 <= policy.backoff(3) <= 4
+
+
+def test_the_policy_should_honor_retry_after_headers():
+    policy = RespectfulRetryPolicy(backoff_factor=1, jitter=False)
+
+    assert policy.backoff(1, response=build_response(429, {"Retry-After": "30"})) == 30
+    assert policy.backoff(3, response=build_response(429, {"Retry-After": "1"})) == 4
+
+    retry_date = email.utils.formatdate(time.time() + 120, usegmt=True)
+    assert 100 < policy.backoff(1, response=build_response(503, {"Retry-After": retry_date})) <= 120
+
+    assert policy.backoff(1, response=build_response(503, {"Retry-After": "garbage"})) == 1
+
+    policy = RespectfulRetryPolicy(backoff_factor=1, jitter=False, respect_retry_after=False)
+    assert policy.backoff(1, response=build_response(429, {"Retry-After": "30"})) == 1
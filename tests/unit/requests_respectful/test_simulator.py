@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import pytest
+import json
+import time
+
+from requests_respectful import RespectfulSimulator
+from requests_respectful.exceptions import RequestsRespectfulError, RequestsRespectfulConfigError
+
+
+def burst(amount, realm="TEST123", timestamp=1000.0, latency=0.1, **kwargs):
+    return [dict({"timestamp": timestamp, "realm": realm, "latency": latency}, **kwargs) for i in range(amount)]
+
+
+# Tests
+
+def test_the_simulator_should_validate_its_configuration():
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulSimulator(realms={"TEST123": {"max_requests": 10, "timespan": 1}}, concurrency=0)
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulSimulator(realms={"TEST123": {"max_requests": 10, "timespan": "FOO"}})
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulSimulator(realms={"TEST123": {"max_requests": 10, "timespan": 1, "windows": [(5, "BAR")]}})
+
+    with pytest.raises(RequestsRespectfulConfigError):
+        RespectfulSimulator(realms={"TEST123": {"max_requests": 10, "timespan": 1}}, service_delay=2)
+
+
+def test_the_simulator_should_validate_its_trace():
+    simulator = RespectfulSimulator(realms={"TEST123": {"max_requests": 10, "timespan": 1}}, safety_threshold=0)
+
+    with pytest.raises(RequestsRespectfulError):
+        simulator.run([{"realm": "TEST123"}])
+
+    with pytest.raises(RequestsRespectfulError):
+        simulator.run([{"timestamp": 1000.0, "realm": "TEST234"}])
+
+    with pytest.raises(RequestsRespectfulError):
+        simulator.run([{"timestamp": 1000.0, "realm": "TEST123", "cost": 11}])
+
+
+def test_the_simulator_should_admit_requests_under_the_limits_without_waiting():
+    simulator = RespectfulSimulator(realms={"TEST123": {"max_requests": 10, "timespan": 1}}, safety_threshold=0, concurrency=10)
+
+    report = simulator.run(burst(10))
+
+    assert report["requests"] == 10
+    assert report["admitted"] == 10
+    assert report["dropped"] == 0
+    assert report["wait"]["max"] == 0
+    assert report["violations"] == {"TEST123": 0}
+    assert report["duration"] == pytest.approx(0.1)
+
+
+def test_the_simulator_should_make_rate_limited_requests_wait_on_the_virtual_clock():
+    simulator = RespectfulSimulator(realms={"TEST123": {"max_requests": 10, "timespan": 60}}, safety_threshold=0, concurrency=20)
+
+    started_at = time.time()
+    report = simulator.run(burst(20))
+
+    assert time.time() - started_at < 5
+
+    assert report["admitted"] == 20
+    assert report["wait"]["p50"] == 0
+    assert 60 <= report["wait"]["max"] <= 62
+    assert report["throughput"] == pytest.approx(20 / report["duration"])
+    assert report["violations"] == {"TEST123": 0}
+
+
+def test_the_simulator_should_drop_requests_waiting_longer_than_the_wait_timeout():
+    realms = {"TEST123": {"max_requests": 10, "timespan": 60}}
+
+    report = RespectfulSimulator(realms=realms, safety_threshold=0, concurrency=20, wait_timeout=5).run(burst(20))
+
+    assert report["admitted"] == 10
+    assert report["dropped"] == 10
+
+    report = RespectfulSimulator(realms=realms, safety_threshold=0, concurrency=20, wait=False).run(burst(20))
+
+    assert report["admitted"] == 10
+    assert report["dropped"] == 10
+
+
+def test_the_simulator_should_queue_requests_on_busy_workers():
+    simulator = RespectfulSimulator(realms={"TEST123": {"max_requests": 100, "timespan": 1}}, safety_threshold=0, concurrency=2)
+
+    report = simulator.run(burst(4, latency=1))
+
+    assert report["admitted"] == 4
+    assert report["wait"]["max"] == pytest.approx(1)
+    assert report["duration"] == pytest.approx(2)
+
+
+def test_the_simulator_should_enforce_the_concurrency_of_a_realm():
+    simulator = RespectfulSimulator(
+        realms={"TEST123": {"max_requests": 100, "timespan": 1, "max_concurrent": 1}},
+        safety_threshold=0,
+        concurrency=4,
+        retry_interval=0.5
+    )
+
+    report = simulator.run(burst(2, latency=1))
+
+    assert report["admitted"] == 2
+    assert report["wait"]["max"] == pytest.approx(1)
+    assert report["violations"] == {"TEST123": 0}
+
+
+def test_the_simulator_should_hold_the_concurrency_leases_of_long_requests_until_they_complete():
+    simulator = RespectfulSimulator(
+        realms={"TEST123": {"max_requests": 100, "timespan": 1, "max_concurrent": 2}},
+        safety_threshold=0,
+        concurrency=4
+    )
+
+    report = simulator.run(burst(4, latency=120))
+
+    assert report["admitted"] == 4
+    assert report["wait"]["p50"] == 0
+    assert report["wait"]["max"] == pytest.approx(120)
+    assert report["violations"] == {"TEST123": 0}
+
+
+def test_the_simulator_should_report_the_violations_of_the_service_limits():
+    trace = burst(10, latency=0) + burst(10, timestamp=1000.5, latency=0)
+
+    report = RespectfulSimulator(
+        realms={"TEST123": {"max_requests": 20, "timespan": 1}},
+        service_realms={"TEST123": {"max_requests": 10, "timespan": 1}},
+        safety_threshold=0,
+        concurrency=10
+    ).run(trace)
+
+    assert report["admitted"] == 20
+    assert report["violations"] == {"TEST123": 10}
+
+    report = RespectfulSimulator(
+        realms={"TEST123": {"max_requests": 10, "timespan": 1}},
+        safety_threshold=0,
+        concurrency=10
+    ).run(trace)
+
+    assert report["violations"] == {"TEST123": 0}
+
+
+def test_the_simulator_should_sweep_configurations_and_concurrency_levels(tmpdir):
+    trace_path = tmpdir.join("trace.jsonl")
+    trace_path.write("\n".join(json.dumps(entry) for entry in burst(20, latency=1)))
+
+    trace = RespectfulSimulator.load_trace(str(trace_path))
+    assert len(trace) == 20
+
+    configurations = [
+        {"realms": {"TEST123": {"max_requests": 100, "timespan": 1}}, "safety_threshold": 0},
+        {"realms": {"TEST123": {"max_requests": 100, "timespan": 1}}, "safety_threshold": 90, "wait": False}
+    ]
+
+    reports = RespectfulSimulator.sweep(trace, configurations, concurrency_levels=[1, 10])
+
+    assert [(report["configuration"], report["concurrency"]) for report in reports] == [
+        (configurations[0], 1), (configurations[0], 10), (configurations[1], 1), (configurations[1], 10)
+    ]
+
+    assert [report["duration"] for report in reports[:2]] == [pytest.approx(20), pytest.approx(2)]
+    assert [report["admitted"] for report in reports[2:]] == [20, 10]